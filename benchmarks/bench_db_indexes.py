@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Query cost on a pre-migration schema vs. the indexed schema.
+
+Builds a throwaway SQLite database with 10k devices and 1M notifications,
+times the hot queries issued by the daemons and the API, applies the
+migrations from slam.db and times them again. The migrations move the
+per-network devices table into the shared devices table, so the device
+lookups after them are scoped by subnet_id.
+
+    python benchmarks/bench_db_indexes.py [--devices N] [--notifications N]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+
+from slam.db import MIGRATIONS
+
+TABLE = "devices_bench"
+
+
+def _ip(i):
+    return f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"
+
+
+def _mac(i):
+    return ":".join(f"{i >> shift & 255:02x}" for shift in (40, 32, 24, 16, 8, 0))
+
+
+def build(path, devices, notifications):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        f"CREATE TABLE {TABLE} (id INTEGER PRIMARY KEY, ip_address VARCHAR, "
+        "hostname VARCHAR, vendor VARCHAR, mac_address VARCHAR, status VARCHAR, "
+        "first_seen DATETIME, last_seen DATETIME, ports JSON)"
+    )
+    conn.execute(
+        "CREATE TABLE notifications (id INTEGER PRIMARY KEY, ssid VARCHAR, "
+        "ip_address VARCHAR, hostname VARCHAR, message VARCHAR, service VARCHAR, "
+        "read BOOLEAN, timestamp DATETIME)"
+    )
+    now = datetime.now()
+    conn.executemany(
+        f"INSERT INTO {TABLE} (ip_address, hostname, vendor, mac_address, status, "
+        "first_seen, last_seen, ports) VALUES (?, ?, 'Vendor', ?, 'online', ?, ?, '[]')",
+        ((_ip(i), f"host-{i}", _mac(i), now, now) for i in range(devices)),
+    )
+    ssids = [f"net-{i}" for i in range(20)]
+    conn.executemany(
+        "INSERT INTO notifications (ssid, ip_address, hostname, message, service, "
+        "read, timestamp) VALUES (?, ?, ?, 'Host is offline.', 'Host Updater Service', ?, ?)",
+        (
+            (
+                random.choice(ssids),
+                f"10.0.0.{i & 255}",
+                f"host-{i & 255}",
+                i < notifications - 500,
+                now - timedelta(seconds=notifications - i),
+            )
+            for i in range(notifications)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def timed(conn, label, sql, params=(), repeat=1):
+    start = time.perf_counter()
+    for i in range(repeat):
+        conn.execute(sql, params(i) if callable(params) else params).fetchall()
+    elapsed = (time.perf_counter() - start) / repeat
+    plan = conn.execute(
+        f"EXPLAIN QUERY PLAN {sql}", params(0) if callable(params) else params
+    ).fetchall()
+    print(f"  {label:<38} {elapsed * 1000:10.3f} ms   {plan[-1][-1]}")
+
+
+def run_queries(path, devices, scope=f"{TABLE} WHERE"):
+    conn = sqlite3.connect(path)
+    timed(
+        conn,
+        "device lookup by ip_address (x200)",
+        f"SELECT * FROM {scope} ip_address = ?",
+        lambda i: (_ip(i * 37 % devices),),
+        repeat=200,
+    )
+    timed(
+        conn,
+        "device lookup by mac_address (x200)",
+        f"SELECT * FROM {scope} mac_address = ?",
+        lambda i: (_mac(i * 37 % devices),),
+        repeat=200,
+    )
+    timed(
+        conn,
+        "latest 50 notifications",
+        "SELECT * FROM notifications ORDER BY timestamp DESC LIMIT 50",
+    )
+    timed(
+        conn,
+        "unread notifications",
+        "SELECT id FROM notifications WHERE read = 0",
+    )
+    timed(
+        conn,
+        "latest 50 notifications for one ssid",
+        "SELECT * FROM notifications WHERE ssid = ? ORDER BY timestamp DESC LIMIT 50",
+        ("net-3",),
+    )
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=10_000)
+    parser.add_argument("--notifications", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        print(
+            f"[+] Building {args.devices} devices / {args.notifications} notifications"
+        )
+        build(path, args.devices, args.notifications)
+
+        print("[+] Before migrations")
+        run_queries(path, args.devices)
+
+        engine = create_engine(f"sqlite:///{path}")
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            for _, _, migrate in MIGRATIONS:
+                migrate(conn)
+        engine.dispose()
+        print(f"[+] Migrations applied in {time.perf_counter() - start:.2f} s")
+
+        print("[+] After migrations")
+        run_queries(path, args.devices, scope="devices WHERE subnet_id = 1 AND")
+
+
+if __name__ == "__main__":
+    main()
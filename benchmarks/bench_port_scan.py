@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Top-ports scan of a /24 with the asyncio connect engine vs. nmap.
+
+Binds listeners on a few top ports of every fourth address in a loopback
+/24 (127.42.0.0/24 by default), scans all 254 hosts with each engine,
+checks the open ports found against the listeners and prints timings.
+The nmap engine is skipped when nmap is not installed.
+
+    python benchmarks/bench_port_scan.py [--network 127.42.0] [--top-ports N]
+"""
+import argparse
+import shutil
+import socket
+import time
+
+from slam.connect_scan import top_ports
+from slam.scanner import batch_port_scan
+
+LISTEN_PORTS = [8080, 3306, 5432, 8443]
+
+
+def listen(network):
+    sockets, expected = [], {}
+    for host in range(1, 255, 4):
+        ip = f"{network}.{host}"
+        for port in LISTEN_PORTS:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((ip, port))
+            sock.listen(128)
+            sockets.append(sock)
+            expected.setdefault(ip, set()).add(port)
+    return sockets, expected
+
+
+def run(engine, ips, count):
+    start = time.perf_counter()
+    found = {}
+    for ip, tcp in batch_port_scan(ips, top_ports=count, engine=engine):
+        found[ip] = {p for p, d in tcp.items() if d.get("state") == "open"}
+    return time.perf_counter() - start, found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--network", default="127.42.0")
+    parser.add_argument("--top-ports", type=int, default=100)
+    args = parser.parse_args()
+
+    missing = set(LISTEN_PORTS) - set(top_ports(args.top_ports))
+    if missing:
+        parser.error(f"ports {sorted(missing)} are not in the top {args.top_ports}")
+
+    sockets, expected = listen(args.network)
+    ips = [f"{args.network}.{host}" for host in range(1, 255)]
+    print(f"[+] {len(sockets)} listeners on {len(expected)} of {len(ips)} hosts")
+    try:
+        engines = ["connect"] + (["nmap"] if shutil.which("nmap") else [])
+        for engine in engines:
+            elapsed, found = run(engine, ips, args.top_ports)
+            hits = {ip: ports for ip, ports in found.items() if ports}
+            status = "ok" if hits == expected else "MISMATCH"
+            print(
+                f"  {engine:<8} {elapsed:8.2f} s   {len(found):3} hosts up   "
+                f"open ports {status}"
+            )
+        if "nmap" not in engines:
+            print("  nmap     skipped (not installed)")
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from slam.db import init_db, SessionLocal
+from slam.db import init_db, SessionLocal, submit_write
 
 init_db()
 from slam.helper import banner, check_dependency
@@ -11,22 +11,27 @@ if not dependecy:
 else:
     print(f"[+] All tools Installed")
 
-from fastapi import FastAPI, Request, Query
+from fastapi import FastAPI, Request, Query, Response, HTTPException
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import select, desc
+from sqlalchemy import select, func
 from slam.scanner import (
     stream_discover_hosts,
     stream_port_scan,
 )
-from slam.models import Subnet, Notification, get_device_table
-import threading
+from slam.models import Subnet, Notification, Device, subnet_devices
+from slam.device_cache import get_snapshot
 import json
-from slam.host_discovery_daemon import disovery_run_forever
-from slam.port_scan_daemon import port_scan_run_forever
-from slam.ws_broadcast import start_ws_server
+from datetime import datetime
+from slam import host_discovery_daemon, port_scan_daemon
+from slam.scheduler import scheduler
+from slam.ws_broadcast import start_ws_server, stats as ws_stats
+from slam.presence_history import presence_report
+from slam.port_history import port_events, first_opened, hosts_exposing
+from slam.notifications import notification_filters, notifications_page
 from slam.helper import update_configurations, read_notifications, get_network_info
 from slam.config import load_config, HOST_DISCOVERY, HOST_UPDATER, PORT_SCAN
+from slam.config import PRESENCE_HISTORY_DAYS
 
 app = FastAPI()
 
@@ -36,22 +41,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 start_ws_server()
 
 if HOST_DISCOVERY or HOST_UPDATER:
-    threading.Thread(target=disovery_run_forever, daemon=True).start()
+    host_discovery_daemon.schedule(scheduler)
 else:
     print(
         "Host Discovery and Host Updater are both disabled. Background service will not run."
     )
 
 if PORT_SCAN:
-    threading.Thread(target=port_scan_run_forever, daemon=True).start()
+    port_scan_daemon.schedule(scheduler)
 else:
     print("Port Scanner is disabled. Background service will not run.")
 
+scheduler.start()
+
 
 @app.get("/api/netinfo")
 def netinfo():
@@ -91,16 +99,12 @@ def list_subnets():
         session.close()
 
 
-@app.get("/api/devices")
-def get_devices(ssid: str = Query(None)):
+def _load_devices(ssid):
     session = SessionLocal()
-    if not ssid:
-        session.close()
-        return []
-
     try:
-        table = get_device_table(ssid)
-        results = session.execute(select(table)).fetchall()
+        results = session.execute(
+            select(Device.__table__).where(subnet_devices(ssid))
+        ).fetchall()
         return [
             {
                 "ip_address": row.ip_address,
@@ -114,31 +118,98 @@ def get_devices(ssid: str = Query(None)):
             }
             for row in results
         ]
+    finally:
+        session.close()
+
+
+@app.get("/api/devices")
+def get_devices(request: Request, ssid: str = Query(None)):
+    """
+    Serves the SSID's device list from the snapshot cache. The ETag changes
+    only when a scan writes to the table, so polling clients sending
+    If-None-Match get a 304 without touching SQLite.
+    """
+    if not ssid:
+        return []
+
+    try:
+        etag, body = get_snapshot(ssid, lambda: _load_devices(ssid))
     except Exception as e:
         print(f"Error accessing table for SSID '{ssid}': {e}")
         return []
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    # If-None-Match uses the weak comparison, so W/ tags match as well.
+    tags = {
+        tag.strip().removeprefix("W/")
+        for tag in request.headers.get("if-none-match", "").split(",")
+    }
+    if etag in tags or "*" in tags:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _encode_cursor(timestamp, id):
+    return f"{timestamp.isoformat()}_{id}"
+
+
+def _decode_cursor(cursor):
+    try:
+        timestamp, id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(timestamp), int(id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@app.get("/api/notifications")
+def get_notifications(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: str = Query(None),
+    ssid: str = Query(None),
+    service: str = Query(None),
+    read: bool = Query(None),
+    since: datetime = Query(None),
+    until: datetime = Query(None),
+):
+    """
+    Newest-first page of notifications, keyset-paginated on (timestamp, id).
+    Pass the X-Next-Cursor header of a page as `cursor` to get the next one;
+    the header is absent on the last page.
+    """
+    filters = notification_filters(ssid, service, read, since, until)
+    after = _decode_cursor(cursor) if cursor else None
+    session = SessionLocal()
+    try:
+        rows, next_key = notifications_page(session, filters, limit, after)
     finally:
         session.close()
 
+    if next_key is not None:
+        response.headers["X-Next-Cursor"] = _encode_cursor(*next_key)
+    return [
+        {
+            "id": n.id,
+            "ssid": n.ssid,
+            "ip_address": n.ip_address,
+            "hostname": n.hostname,
+            "message": n.message,
+            "service": n.service,
+            "timestamp": n.timestamp.isoformat(),
+            "read": n.read,
+        }
+        for n in rows
+    ]
 
-@app.get("/api/notifications")
-def get_notifications():
+
+@app.get("/api/notifications/unread-count")
+def get_unread_count(ssid: str = Query(None)):
+    filters = notification_filters(ssid, read=False)
     session = SessionLocal()
     try:
-        items = session.query(Notification).order_by(desc(Notification.timestamp)).all()
-        return [
-            {
-                "id": n.id,
-                "ssid": n.ssid,
-                "ip_address": n.ip_address,
-                "hostname": n.hostname,
-                "message": n.message,
-                "service": n.service,
-                "timestamp": n.timestamp.isoformat(),
-                "read": n.read,
-            }
-            for n in items
-        ]
+        unread = session.execute(
+            select(func.count()).select_from(Notification).where(*filters)
+        ).scalar()
+        return {"unread": unread}
     finally:
         session.close()
 
@@ -164,25 +235,91 @@ async def update_settings(request: Request):
 
 @app.post("/api/notifications/mark-read")
 def mark_notifications_as_read():
+    read_notifications()
+    return {"status": "ok"}
+
+
+def _delete_notifications(session):
+    return session.query(Notification).delete()
+
+
+@app.post("/api/notifications/delete")
+def delete_notifications():
+    deleted = submit_write(_delete_notifications).result()
+    return {"deleted": deleted}
+
+
+@app.get("/api/presence")
+def presence(
+    ssid: str = Query(None),
+    days: int = Query(30, ge=1, le=PRESENCE_HISTORY_DAYS),
+    ip: list[str] = Query(None),
+):
+    """
+    Per-host uptime, hour-of-day availability heatmap and flap count for the
+    SSID over the last `days` days.
+    """
+    if not ssid:
+        ssid = get_network_info()[0]
     session = SessionLocal()
     try:
-        read_notifications()
-        return {"status": "ok"}
+        return presence_report(session, ssid, days=days, ips=ip)
     finally:
         session.close()
 
 
-@app.post("/api/notifications/delete")
-def delete_notifications():
+@app.get("/api/ports/events")
+def get_port_events(
+    ssid: str = Query(None),
+    ip: str = Query(None),
+    port: int = Query(None),
+    since: datetime = Query(None),
+    until: datetime = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    Newest-first port open/close events. With both `ip` and `port`, also
+    reports when that port was first seen open on the host.
+    """
+    if not ssid:
+        ssid = get_network_info()[0]
+    session = SessionLocal()
+    try:
+        result = {
+            "events": port_events(session, ssid, ip, port, since, until, limit)
+        }
+        if ip is not None and port is not None:
+            opened = first_opened(session, ssid, ip, port)
+            result["first_opened"] = opened.isoformat() if opened else None
+        return result
+    finally:
+        session.close()
+
+
+@app.get("/api/ports/exposed")
+def get_exposed_hosts(
+    port: int = Query(...), ssid: str = Query(None), at: datetime = Query(None)
+):
+    """
+    Hosts that had `port` open at time `at` (default now).
+    """
+    if not ssid:
+        ssid = get_network_info()[0]
     session = SessionLocal()
     try:
-        deleted = session.query(Notification).delete()
-        # deleted=100
-        session.commit()
-        return {"deleted": deleted}
+        return hosts_exposing(session, ssid, port, at or datetime.now())
     finally:
-        # session.close()
-        pass
+        session.close()
+
+
+@app.get("/api/scheduler")
+def scheduler_jobs():
+    return scheduler.status()
+
+
+@app.get("/api/ws/stats")
+def websocket_stats():
+    return ws_stats()
 
 
 @app.get("/api/scan-stream")
@@ -200,9 +337,14 @@ def scan_stream(mode: str = Query("discover_hosts")):
                 yield f"data: {json.dumps({'error': 'Unsupported mode'})}\n\n"
                 return
 
-            for host in scan_generator:
-                count += 1
-                yield f"data: {json.dumps({'host': host})}\n\n"
+            # On-demand scans queue behind a scheduled sweep or port scan
+            # instead of running alongside it.
+            if scheduler.busy():
+                yield f"data: {json.dumps({'status': 'waiting'})}\n\n"
+            with scheduler.exclusive():
+                for host in scan_generator:
+                    count += 1
+                    yield f"data: {json.dumps({'host': host})}\n\n"
 
             yield f"data: {json.dumps({'total': count})}\n\n"
             yield "event: done\ndata: end\n\n"
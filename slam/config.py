@@ -1,3 +1,4 @@
+import os
 from slam.models import Config
 from slam.db import SessionLocal
 
@@ -38,3 +39,40 @@ PORT_DISCOVERY_NOTIFICATION = config_values.get("port_discovery_notification", T
 HOST_DISCOVERY_NOTIFICATION = config_values.get("host_discovery_notification", True)
 HOST_UPDATE_NOTIFICATION = config_values.get("host_update_notification", True)
 PORT_SCAN_TOP_PORTS = config_values.get("port_scan_top_ports", 100)
+ENRICHMENT_WORKERS = 16
+ENRICHMENT_HOST_TIMEOUT = 45
+NBNS_TIMEOUT = 2
+PORT_SCAN_BATCH_SIZE = 16
+PORT_SCAN_WORKERS = 4
+LAST_SEEN_RESOLUTION = 5
+NETWORK_INFO_TTL = 60
+NETWORK_CHANGE_DEBOUNCE = 5
+WS_CLIENT_QUEUE_SIZE = 256
+WS_SEND_TIMEOUT = 5
+WS_SLOW_CLIENT_GRACE = 30
+WS_EVENT_BUFFER = 1024
+SCHEDULER_JITTER = 0.1
+SCHEDULER_CHURN_THRESHOLD = 0.05
+PORT_SCAN_STALE_AFTER = 6 * 60
+PORT_SCAN_OFFLINE_GRACE = 24 * 60
+PORT_SCAN_MAX_HOSTS = 256
+PORT_SCAN_ROTATE = False
+PORT_SCAN_ENGINE = "nmap"
+CONNECT_SCAN_CONCURRENCY = 512
+CONNECT_SCAN_PER_HOST = 64
+CONNECT_SCAN_TIMEOUT = 1.0
+CONNECT_SCAN_RETRIES = 1
+HOST_DISCOVERY_PASSIVE = True
+HOST_DISCOVERY_FULL_SWEEP_INTERVAL = 60
+OUI_DB_PATH = os.path.expanduser("~/.cache/slam/oui.bin")
+HOSTNAME_DNS_TIMEOUT = 2
+HOSTNAME_CACHE_SIZE = 4096
+HOSTNAME_CACHE_TTL = 24 * 60 * 60
+HOSTNAME_NEGATIVE_TTL = 30 * 60
+MDNS_TIMEOUT = 1.5
+MDNS_SERVICE_TIMEOUT = 3
+MDNS_CACHE_SIZE = 4096
+PRESENCE_LISTENER = False
+PRESENCE_FLUSH_INTERVAL = 5
+PRESENCE_SLOT_MINUTES = 5
+PRESENCE_HISTORY_DAYS = 90
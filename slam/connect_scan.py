@@ -0,0 +1,191 @@
+import asyncio
+import os
+import socket
+import struct
+from functools import lru_cache
+from slam.config import (
+    CONNECT_SCAN_CONCURRENCY,
+    CONNECT_SCAN_PER_HOST,
+    CONNECT_SCAN_TIMEOUT,
+    CONNECT_SCAN_RETRIES,
+)
+
+NMAP_SERVICES_PATHS = (
+    "/usr/share/nmap/nmap-services",
+    "/usr/local/share/nmap/nmap-services",
+    "/opt/homebrew/share/nmap/nmap-services",
+)
+
+# nmap's 100 most common TCP ports, most frequent first; used when no
+# nmap-services file is installed.
+TOP_TCP_PORTS = [
+    80, 23, 443, 21, 22, 25, 3389, 110, 445, 139, 143, 53, 135, 3306, 8080,
+    1723, 111, 995, 993, 5900, 1025, 587, 8888, 199, 1720, 465, 548, 113, 81,
+    6001, 10000, 514, 5060, 179, 1026, 2000, 8443, 8000, 32768, 554, 26, 1433,
+    49152, 2001, 515, 8008, 49154, 1027, 5666, 646, 5000, 5631, 631, 49153,
+    8081, 2049, 88, 79, 5800, 106, 2121, 1110, 49155, 6000, 513, 990, 5357,
+    427, 49156, 543, 544, 5101, 144, 7, 389, 9, 13, 37, 119, 444, 873, 1028,
+    1029, 1755, 1900, 2717, 3000, 3128, 3986, 4899, 5009, 5051, 5190, 5432,
+    6646, 7070, 8009, 9100, 9999, 49157,
+]  # fmt: skip
+
+
+@lru_cache(maxsize=1)
+def load_nmap_services():
+    """
+    Reads the TCP entries of nmap-services as {port: (name, frequency)}.
+    Returns an empty dict when nmap's data files are not installed.
+    """
+    for path in NMAP_SERVICES_PATHS:
+        if not os.path.exists(path):
+            continue
+        services = {}
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if line.startswith("#"):
+                    continue
+                parts = line.split()
+                if len(parts) < 3 or not parts[1].endswith("/tcp"):
+                    continue
+                try:
+                    services[int(parts[1][:-4])] = (parts[0], float(parts[2]))
+                except ValueError:
+                    continue
+        return services
+    return {}
+
+
+def top_ports(count):
+    """
+    Returns the `count` most common TCP ports, by nmap-services frequency
+    when available, so both engines scan the same set.
+    """
+    services = load_nmap_services()
+    if services:
+        ranked = sorted(services, key=lambda port: -services[port][1])
+        return ranked[:count]
+    return TOP_TCP_PORTS[:count]
+
+
+def parse_port_spec(spec):
+    """
+    Expands an nmap -p spec such as "22,80-90" into a list of ports. As in
+    nmap, an open-ended range ("-1024", "60000-") runs to the first or last
+    port. Raises ValueError on anything else.
+    """
+    ports = []
+    for part in spec.split(","):
+        start, dash, end = part.strip().partition("-")
+        first = int(start) if start or not dash else 1
+        last = (int(end) if end else 65535) if dash else first
+        if not 0 < first <= last <= 65535:
+            raise ValueError(f"invalid port range: {part.strip()}")
+        ports.extend(range(first, last + 1))
+    return ports
+
+
+@lru_cache(maxsize=None)
+def _service_name(port):
+    entry = load_nmap_services().get(port)
+    if entry:
+        return entry[0]
+    try:
+        return socket.getservbyport(port, "tcp")
+    except OSError:
+        return ""
+
+
+async def probe_port(
+    ip, port, timeout=CONNECT_SCAN_TIMEOUT, retries=CONNECT_SCAN_RETRIES
+):
+    """
+    Tries a full TCP connect and returns "open", "closed" (refused) or
+    "filtered" (no answer within the timeout after `retries` retries).
+    """
+    loop = asyncio.get_running_loop()
+    family = socket.AF_INET6 if ":" in ip else socket.AF_INET
+    for _ in range(retries + 1):
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.setblocking(False)
+            # Reset instead of a FIN handshake, so scans leave no TIME_WAIT.
+            sock.setsockopt(
+                socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+            )
+            await asyncio.wait_for(loop.sock_connect(sock, (ip, port)), timeout)
+            return "open"
+        except asyncio.TimeoutError:
+            continue
+        except ConnectionRefusedError:
+            return "closed"
+        except OSError:
+            return "filtered"
+        finally:
+            sock.close()
+    return "filtered"
+
+
+def _port_entry(port, state):
+    return {
+        "state": state,
+        "reason": "syn-ack" if state == "open" else "conn-refused",
+        "name": _service_name(port),
+        "product": "",
+        "version": "",
+        "extrainfo": "",
+        "conf": "3",
+    }
+
+
+async def stream_connect_scan(
+    ips,
+    ports,
+    concurrency=CONNECT_SCAN_CONCURRENCY,
+    per_host=CONNECT_SCAN_PER_HOST,
+    timeout=CONNECT_SCAN_TIMEOUT,
+    retries=CONNECT_SCAN_RETRIES,
+):
+    """
+    Connect-scans every port of every host with `concurrency` workers and
+    yields (ip, tcp) in python-nmap shape, with open and closed ports, as
+    each host finishes. Probes are handed out port by port across hosts so
+    the load spreads over the subnet, and no host has more than `per_host`
+    connections in flight. Hosts where every port timed out are treated as
+    down and left out, as nmap does.
+    """
+    ips, ports = list(ips), list(ports)
+    host_limits = {ip: asyncio.Semaphore(per_host) for ip in ips}
+    remaining = {ip: len(ports) for ip in ips}
+    answered = {ip: {} for ip in ips}
+    work = ((ip, port) for port in ports for ip in ips)
+    finished = asyncio.Queue()
+
+    async def worker():
+        try:
+            for ip, port in work:
+                async with host_limits[ip]:
+                    state = await probe_port(ip, port, timeout, retries)
+                if state != "filtered":
+                    answered[ip][port] = state
+                remaining[ip] -= 1
+                if not remaining[ip]:
+                    finished.put_nowait(ip)
+        except Exception as e:
+            finished.put_nowait(e)
+
+    count = min(concurrency, len(ips) * len(ports))
+    workers = [asyncio.create_task(worker()) for _ in range(count)]
+    try:
+        for _ in range(len(ips) if ports else 0):
+            ip = await finished.get()
+            if isinstance(ip, Exception):
+                raise ip
+            if answered[ip]:
+                yield ip, {
+                    port: _port_entry(port, state)
+                    for port, state in sorted(answered[ip].items())
+                }
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
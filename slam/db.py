@@ -1,7 +1,12 @@
 # db.py
-from sqlalchemy import create_engine, inspect, text
-from sqlalchemy.orm import sessionmaker
-from slam.models import Base, Config, get_device_table
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from sqlalchemy import create_engine, event, inspect, insert, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker, Session
+from slam.models import Base, Config, Subnet, Device, PortEvent
 
 engine = create_engine(
     "sqlite:///slam.db", connect_args={"check_same_thread": False, "timeout": 20}
@@ -9,6 +14,121 @@ engine = create_engine(
 SessionLocal = sessionmaker(bind=engine)
 
 
+# pysqlite begins transactions on its own and not before a SAVEPOINT, so a
+# writer group would commit job by job. Let SQLAlchemy issue BEGIN itself
+# (the documented pysqlite recipe) so a group is a single transaction.
+@event.listens_for(engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+@event.listens_for(engine, "begin")
+def _on_begin(conn):
+    conn.exec_driver_sql("BEGIN")
+
+
+class DBWriter:
+    """
+    Single writer thread that owns the only write connection to slam.db.
+
+    Callers submit `fn(session, *args)` and get a Future back. Queued jobs
+    are applied in order, each inside its own savepoint so one failing job
+    does not sink the others, and committed together as one group commit.
+    """
+
+    def __init__(self, max_batch=64):
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self._queue.put((fn, args, kwargs, future))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return [job for job in batch if job[3].set_running_or_notify_cancel()]
+
+    def _apply(self, session, batch):
+        outcomes = []
+        callbacks = session.info.setdefault("after_commit", [])
+        for fn, args, kwargs, _ in batch:
+            registered = len(callbacks)
+            try:
+                with session.begin_nested():
+                    outcomes.append((True, fn(session, *args, **kwargs)))
+            except Exception as e:
+                del callbacks[registered:]
+                outcomes.append((False, e))
+        session.commit()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[-] After-commit callback failed: {e}")
+        return outcomes
+
+    def _run(self):
+        connection = engine.connect()
+        while True:
+            batch = self._next_batch()
+            # Other processes can still hold the lock briefly; the group is
+            # one transaction, so a rolled back group leaves nothing behind
+            # and is safe to replay.
+            for attempt in range(3):
+                session = Session(bind=connection)
+                try:
+                    outcomes = self._apply(session, batch)
+                    break
+                except OperationalError as oe:
+                    session.rollback()
+                    if "locked" not in str(oe).lower() or attempt == 2:
+                        outcomes = [(False, oe)] * len(batch)
+                        break
+                    time.sleep(0.5)
+                except Exception as e:
+                    session.rollback()
+                    outcomes = [(False, e)] * len(batch)
+                    break
+                finally:
+                    session.close()
+            for (_, _, _, future), (ok, value) in zip(batch, outcomes):
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+
+writer = DBWriter()
+
+
+def after_commit(session, callback):
+    """
+    Runs `callback()` once the writer job calling this has been committed;
+    it is dropped if the job fails.
+    """
+    session.info.setdefault("after_commit", []).append(callback)
+
+
+def submit_write(fn, *args, **kwargs):
+    return writer.submit(fn, *args, **kwargs)
+
+
 def init_db():
     try:
         print("[+] Creating tables...")
@@ -17,10 +137,10 @@ def init_db():
     except Exception as e:
         print(f"[-] Error during table creation: {e}")
 
-    # Set the PRAGMA settings
-    with engine.connect() as conn:
-        conn.execute(text("PRAGMA journal_mode=WAL"))
-        conn.execute(text("PRAGMA synchronous=NORMAL"))
+    try:
+        run_migrations()
+    except Exception as e:
+        print(f"[-] Error during schema migration: {e}")
 
     session = SessionLocal()
     try:
@@ -49,8 +169,160 @@ def init_db():
         session.close()
 
 
-def ensure_device_table(ssid):
-    table = get_device_table(ssid)
-    inspector = inspect(engine)
-    if not inspector.has_table(table.name):
-        table.create(engine)
+def _device_table_names(conn):
+    return [
+        row[0]
+        for row in conn.execute(
+            text(
+                "SELECT name FROM sqlite_master "
+                "WHERE type = 'table' AND name LIKE 'devices\\_%' ESCAPE '\\'"
+            )
+        )
+    ]
+
+
+def _index_device_tables(conn):
+    for name in _device_table_names(conn):
+        # Tables created before sweeps were upserted can hold duplicate IPs;
+        # keep the newest row for each so the unique index can be built.
+        conn.execute(
+            text(
+                f'DELETE FROM "{name}" WHERE ip_address IS NOT NULL '
+                f'AND id NOT IN (SELECT MAX(id) FROM "{name}" GROUP BY ip_address)'
+            )
+        )
+        conn.execute(
+            text(
+                f'CREATE UNIQUE INDEX IF NOT EXISTS "ux_{name}_ip_address" '
+                f'ON "{name}" (ip_address)'
+            )
+        )
+        conn.execute(
+            text(
+                f'CREATE INDEX IF NOT EXISTS "ix_{name}_mac_address" '
+                f'ON "{name}" (mac_address)'
+            )
+        )
+
+
+def _index_notifications(conn):
+    for name, columns in (
+        ("ix_notifications_timestamp", "timestamp"),
+        ("ix_notifications_read", "read"),
+        ("ix_notifications_ssid_timestamp", "ssid, timestamp"),
+    ):
+        conn.execute(
+            text(f"CREATE INDEX IF NOT EXISTS {name} ON notifications ({columns})")
+        )
+
+
+def _index_unread_notifications(conn):
+    # (read, timestamp) serves both the unread count and newest-first pages
+    # of unread rows; the plain read index is a redundant prefix of it. The
+    # id tiebreak of keyset pages comes free as the rowid in every index.
+    conn.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_notifications_read_timestamp "
+            "ON notifications (read, timestamp)"
+        )
+    )
+    conn.execute(text("DROP INDEX IF EXISTS ix_notifications_read"))
+
+
+def _add_column(conn, table, column, ddl):
+    columns = [row[1] for row in conn.execute(text(f'PRAGMA table_info("{table}")'))]
+    if columns and column not in columns:
+        conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+
+
+def _track_port_scans(conn):
+    for name in _device_table_names(conn):
+        _add_column(conn, name, "last_port_scan", "DATETIME")
+    _add_column(conn, "subnets", "port_scan_cursor", "INTEGER DEFAULT 1")
+
+
+def _legacy_device_tables(conn):
+    # devices_<ssid> table name -> (subnet id, ssid) for the per-network
+    # tables used before all devices moved into one table.
+    names = set(_device_table_names(conn))
+    if not names or not inspect(conn).has_table("subnets"):
+        return {}
+    tables = {}
+    for id, ssid in conn.execute(select(Subnet.id, Subnet.ssid)):
+        name = f"devices_{ssid.replace('-', '_').replace('.', '_')}"
+        if name in names:
+            tables[name] = (id, ssid)
+    return tables
+
+
+def _seed_port_events(conn):
+    # Ports already open when the event log was introduced get an "open"
+    # event at the time they were last confirmed, so history starts from
+    # the current state rather than from nothing.
+    PortEvent.__table__.create(conn, checkfirst=True)
+    for table, (_, ssid) in _legacy_device_tables(conn).items():
+        conn.execute(
+            text(
+                "INSERT INTO port_events "
+                "(ssid, ip_address, mac_address, port, proto, state, timestamp) "
+                "SELECT :ssid, d.ip_address, d.mac_address, p.value, 'tcp', 'open', "
+                "COALESCE(d.last_port_scan, d.last_seen, d.first_seen, "
+                "datetime('now', 'localtime')) "
+                f'FROM "{table}" d, json_each(d.ports) p '
+                "WHERE d.ip_address IS NOT NULL AND json_valid(d.ports) "
+                "AND p.type = 'integer'"
+            ),
+            {"ssid": ssid},
+        )
+
+
+def _merge_device_tables(conn):
+    Subnet.__table__.create(conn, checkfirst=True)
+    Device.__table__.create(conn, checkfirst=True)
+    subnets = _legacy_device_tables(conn)
+    for name in _device_table_names(conn):
+        if name in subnets:
+            subnet_id = subnets[name][0]
+        else:
+            # A table whose subnet row is gone keeps its devices under a
+            # network named after the table.
+            subnet_id = conn.execute(
+                insert(Subnet.__table__).values(ssid=name[len("devices_") :])
+            ).inserted_primary_key[0]
+        columns = [row[1] for row in conn.execute(text(f'PRAGMA table_info("{name}")'))]
+        last_port_scan = "last_port_scan" if "last_port_scan" in columns else "NULL"
+        # Newest row first, so the newest of any duplicate IPs is kept.
+        conn.execute(
+            text(
+                "INSERT OR IGNORE INTO devices (subnet_id, ip_address, hostname, "
+                "vendor, mac_address, status, first_seen, last_seen, ports, "
+                "last_port_scan) "
+                "SELECT :subnet_id, ip_address, hostname, vendor, mac_address, "
+                f"status, first_seen, last_seen, ports, {last_port_scan} "
+                f'FROM "{name}" WHERE ip_address IS NOT NULL ORDER BY id DESC'
+            ),
+            {"subnet_id": subnet_id},
+        )
+        conn.execute(text(f'DROP TABLE "{name}"'))
+
+
+# Schema migrations, applied in order. PRAGMA user_version records the last
+# one applied, so each runs once per database; append new ones at the end.
+MIGRATIONS = [
+    (1, "index device tables", _index_device_tables),
+    (2, "index notifications", _index_notifications),
+    (3, "index unread notifications", _index_unread_notifications),
+    (4, "track port scan progress", _track_port_scans),
+    (5, "seed port event log", _seed_port_events),
+    (6, "merge device tables", _merge_device_tables),
+]
+
+
+def run_migrations():
+    with engine.begin() as conn:
+        current = conn.execute(text("PRAGMA user_version")).scalar()
+        for version, description, migrate in MIGRATIONS:
+            if version > current:
+                print(f"[+] Applying migration {version}: {description}")
+                migrate(conn)
+                conn.execute(text(f"PRAGMA user_version = {version}"))
@@ -0,0 +1,36 @@
+import json
+import threading
+import uuid
+
+# Versions restart at zero with the process, so ETags carry a per-process tag
+# to keep a client's old ETag from matching a new snapshot after a restart.
+_epoch = uuid.uuid4().hex[:8]
+_versions = {}
+_snapshots = {}
+_lock = threading.Lock()
+
+
+def invalidate(ssid):
+    with _lock:
+        _versions[ssid] = _versions.get(ssid, 0) + 1
+
+
+def get_snapshot(ssid, load):
+    """
+    Returns (etag, body) for an SSID's device list, where body is the
+    serialized JSON of `load()`. The bytes are reused until the next
+    invalidate(ssid); a load that races with an invalidation is served but
+    not cached.
+    """
+    with _lock:
+        version = _versions.setdefault(ssid, 0)
+        cached = _snapshots.get(ssid)
+    if cached and cached[0] == version:
+        return cached[1], cached[2]
+
+    body = json.dumps(load()).encode()
+    etag = f'"{_epoch}-{version}"'
+    with _lock:
+        if _versions.get(ssid) == version:
+            _snapshots[ssid] = (version, etag, body)
+    return etag, body
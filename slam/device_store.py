@@ -0,0 +1,446 @@
+from datetime import timedelta
+from sqlalchemy import select, update, insert, text, and_, or_, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from slam import device_cache
+from slam.db import after_commit
+from slam.ws_broadcast import publish_events
+from slam.oui import lookup_vendor
+from slam.presence_history import record_presence
+from slam.models import Subnet, Notification, PortEvent, Device
+from slam.config import (
+    HOST_DISCOVERY_NOTIFICATION,
+    HOST_UPDATE_NOTIFICATION,
+    PORT_DISCOVERY_NOTIFICATION,
+    LAST_SEEN_RESOLUTION,
+)
+
+
+def _stage_seen_ips(conn, ips):
+    conn.execute(
+        text("CREATE TEMP TABLE IF NOT EXISTS sweep_seen (ip_address TEXT PRIMARY KEY)")
+    )
+    conn.execute(text("DELETE FROM sweep_seen"))
+    if ips:
+        conn.execute(
+            text("INSERT OR IGNORE INTO sweep_seen (ip_address) VALUES (:ip)"),
+            [{"ip": ip} for ip in ips],
+        )
+
+
+def _subnet_id(conn, ssid):
+    return conn.execute(select(Subnet.id).where(Subnet.ssid == ssid)).scalar_one()
+
+
+def upsert_hosts(conn, subnet_id, hosts, now):
+    """
+    Inserts new hosts and refreshes known ones with one executemany. Rows
+    whose hostname, MAC, vendor and status are unchanged are only rewritten
+    when last_seen is older than LAST_SEEN_RESOLUTION minutes. A host that
+    comes back online or changes MAC has last_port_scan cleared, which puts
+    it at the front of the next port scan. Returns how many rows were
+    written.
+    """
+    if not hosts:
+        return 0
+    table = Device.__table__
+    stmt = sqlite_insert(table)
+    excluded = stmt.excluded
+    stale_before = now - timedelta(minutes=LAST_SEEN_RESOLUTION)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.subnet_id, table.c.ip_address],
+        set_={
+            "hostname": excluded.hostname,
+            "mac_address": excluded.mac_address,
+            "vendor": excluded.vendor,
+            "status": excluded.status,
+            "last_seen": excluded.last_seen,
+            "last_port_scan": case(
+                (
+                    or_(
+                        table.c.status == "offline",
+                        table.c.mac_address.is_not(excluded.mac_address),
+                    ),
+                    None,
+                ),
+                else_=table.c.last_port_scan,
+            ),
+        },
+        where=or_(
+            table.c.hostname.is_not(excluded.hostname),
+            table.c.mac_address.is_not(excluded.mac_address),
+            table.c.vendor.is_not(excluded.vendor),
+            table.c.status.is_not(excluded.status),
+            table.c.last_seen.is_(None),
+            table.c.last_seen < stale_before,
+        ),
+    )
+    return conn.execute(
+        stmt,
+        [
+            {
+                "subnet_id": subnet_id,
+                "ip_address": host["ip_address"],
+                "hostname": host["hostname"],
+                "mac_address": host["mac_address"],
+                "vendor": host["vendor"],
+                "status": "online",
+                "first_seen": now,
+                "last_seen": now,
+                "ports": [],
+            }
+            for host in hosts
+        ],
+    ).rowcount
+
+
+def ensure_subnet(session, ssid, subnet, now, values=None):
+    """
+    Returns the subnet CIDR for an SSID, creating the row if needed. When
+    the SSID comes back on another subnet, netmask, interface or broadcast
+    address, the stored values are replaced by the live ones. Runs as a DB
+    writer job.
+    """
+    values = values or {}
+    entry = session.query(Subnet).filter_by(ssid=ssid).first()
+    if not entry:
+        entry = Subnet(ssid=ssid, subnet=subnet, created_at=now, **values)
+        session.add(entry)
+        session.flush()
+        return entry.subnet
+    live = {
+        key: value
+        for key, value in {"subnet": subnet, **values}.items()
+        if value not in (None, "", "Unknown")
+    }
+    changed = [
+        key
+        for key, value in live.items()
+        if key != "updated_by" and getattr(entry, key) != value
+    ]
+    if changed:
+        print(f"[+] Network details changed for {ssid}: {', '.join(changed)}")
+        for key, value in live.items():
+            setattr(entry, key, value)
+        session.flush()
+    return entry.subnet
+
+
+def record_sweep(session, ssid, hosts, now, reconcile=True, subnet_values=None):
+    """
+    Writes the results of one discovery sweep in a single DB writer job, so
+    it lands in one commit.
+
+    `hosts` is a list of dicts with ip_address, hostname, mac_address and
+    vendor. New, recovered and (with `reconcile`) newly offline hosts are
+    worked out with set-based SQL against a temp table of the IPs seen in
+    this sweep, and their notifications are inserted in bulk. The matching
+    device-state deltas are published to WebSocket clients after commit;
+    returns how many there were.
+    """
+    table = Device.__table__
+    seen = {host["ip_address"] for host in hosts}
+    notifications = []
+    events = []
+    offline = []
+
+    conn = session.connection()
+    subnet_id = _subnet_id(conn, ssid)
+    in_subnet = table.c.subnet_id == subnet_id
+    _stage_seen_ips(conn, seen)
+    seen_ips = select(text("ip_address")).select_from(text("sweep_seen"))
+    known = {
+        row.ip_address: row
+        for row in conn.execute(
+            select(
+                table.c.ip_address,
+                table.c.hostname,
+                table.c.mac_address,
+                table.c.vendor,
+                table.c.status,
+            ).where(in_subnet, table.c.ip_address.in_(seen_ips))
+        )
+    }
+
+    for host in hosts:
+        row = known.get(host["ip_address"])
+        if row is None:
+            events.append(
+                {
+                    "type": "host_added",
+                    "ip_address": host["ip_address"],
+                    "hostname": host["hostname"],
+                    "mac_address": host["mac_address"],
+                    "vendor": host["vendor"],
+                    "status": "online",
+                    "first_seen": now.isoformat(),
+                }
+            )
+            continue
+        changed = {
+            field: host[field]
+            for field in ("hostname", "mac_address", "vendor")
+            if getattr(row, field) != host[field]
+        }
+        if row.status == "offline":
+            events.append(
+                {"type": "host_online", "ip_address": row.ip_address, **changed}
+            )
+        elif changed:
+            events.append(
+                {"type": "host_updated", "ip_address": row.ip_address, **changed}
+            )
+
+    if HOST_DISCOVERY_NOTIFICATION:
+        for host in hosts:
+            if host["ip_address"] not in known:
+                notifications.append(
+                    {
+                        "ssid": ssid,
+                        "ip_address": host["ip_address"],
+                        "hostname": host["hostname"],
+                        "message": f"New host discovered: {host['hostname']} ({host['ip_address']})",
+                        "timestamp": now,
+                        "service": "Host Discovery Service",
+                        "read": False,
+                    }
+                )
+
+    if reconcile:
+        went_offline = and_(
+            in_subnet,
+            table.c.status != "offline",
+            table.c.hostname.is_not(None),
+            table.c.hostname != "",
+            table.c.ip_address.not_in(seen_ips),
+        )
+        offline = conn.execute(
+            select(table.c.ip_address, table.c.hostname).where(went_offline)
+        ).fetchall()
+        if offline:
+            conn.execute(
+                update(table)
+                .where(went_offline)
+                .values(last_seen=now, status="offline")
+            )
+        events.extend(
+            {"type": "host_offline", "ip_address": row.ip_address}
+            for row in offline
+        )
+        if HOST_UPDATE_NOTIFICATION:
+            for row in offline:
+                notifications.append(
+                    {
+                        "ssid": ssid,
+                        "ip_address": row.ip_address,
+                        "hostname": row.hostname,
+                        "service": "Host Updater Service",
+                        "message": f"Host {row.hostname} ({row.ip_address}) is offline.",
+                        "timestamp": now,
+                        "read": False,
+                    }
+                )
+
+    # Sightings recover offline hosts as well, so this is not tied to
+    # reconciling; the host_online events were emitted above.
+    recovered = [
+        row for row in known.values() if row.status == "offline" and row.hostname
+    ]
+    if HOST_UPDATE_NOTIFICATION:
+        for row in recovered:
+            notifications.append(
+                {
+                    "ssid": ssid,
+                    "ip_address": row.ip_address,
+                    "hostname": row.hostname,
+                    "service": "Host Updater Service",
+                    "message": f"Host {row.hostname} ({row.ip_address}) is back Online.",
+                    "timestamp": now,
+                    "read": False,
+                }
+            )
+
+    written = upsert_hosts(conn, subnet_id, hosts, now)
+    if reconcile:
+        # A full sweep observes every known host, up or not.
+        observed = [
+            row.ip_address
+            for row in conn.execute(select(table.c.ip_address).where(in_subnet))
+            if row.ip_address
+        ]
+    else:
+        observed = seen
+    record_presence(conn, ssid, seen, observed, now)
+    # Most sweeps and presence flushes change nothing; keeping the version
+    # lets /api/devices keep answering 304.
+    if written or offline:
+        after_commit(session, lambda: device_cache.invalidate(ssid))
+    after_commit(session, lambda: publish_events(ssid, events))
+    if notifications:
+        conn.execute(insert(Notification.__table__), notifications)
+    if subnet_values:
+        conn.execute(
+            update(Subnet.__table__)
+            .where(Subnet.ssid == ssid)
+            .values(last_activity=now, **subnet_values)
+        )
+    return len(events)
+
+
+def record_sightings(session, ssid, sightings, now):
+    """
+    Records hosts seen by the presence listener as online, as a DB writer
+    job. A sighting only carries what its packet revealed, so a missing MAC
+    or hostname falls back to the stored one, and a stored hostname is only
+    replaced while it is unknown. A new or changed MAC gets its vendor from
+    the OUI database. The write goes through record_sweep without
+    reconciling, so events, notifications and last_seen throttling match a
+    sweep's.
+    """
+    table = Device.__table__
+    conn = session.connection()
+    known = {
+        row.ip_address: row
+        for row in conn.execute(
+            select(
+                table.c.ip_address,
+                table.c.hostname,
+                table.c.mac_address,
+                table.c.vendor,
+            ).where(
+                table.c.subnet_id == _subnet_id(conn, ssid),
+                table.c.ip_address.in_([s.ip for s in sightings]),
+            )
+        )
+    }
+    hosts = []
+    for sighting in sightings:
+        row = known.get(sighting.ip)
+        hostname = sighting.hostname or "Unknown"
+        if row is not None and row.hostname not in (None, "", "Unknown"):
+            hostname = row.hostname
+        mac = sighting.mac or (row.mac_address if row is not None else None)
+        if row is not None and (row.mac_address or "").lower() == (mac or "").lower():
+            mac, vendor = row.mac_address, row.vendor
+        else:
+            vendor = (lookup_vendor(mac) if mac else None) or "Unknown"
+        hosts.append(
+            {
+                "ip_address": sighting.ip,
+                "hostname": hostname,
+                "mac_address": mac or "Unknown",
+                "vendor": vendor,
+            }
+        )
+    return record_sweep(session, ssid, hosts, now, reconcile=False)
+
+
+def record_port_scan(
+    session,
+    ssid,
+    device,
+    open_ports,
+    now,
+    service="Port Discovery Service",
+    subnet_values=None,
+    scanned_ports=None,
+):
+    """
+    Stores one host's port scan result as a DB writer job and returns the
+    ports that were not open before. With `scanned_ports` the scan only
+    covered those ports, so open ports found earlier outside them are kept.
+    Every port that opened or closed is appended to port_events.
+    """
+    table = Device.__table__
+    ip, hostname = device.ip_address, device.hostname
+    in_row = and_(table.c.subnet_id == device.subnet_id, table.c.ip_address == ip)
+    # `device` was loaded before the scan; another scan of the same host may
+    # have been stored since, so diff against the row as it is now.
+    current = session.execute(
+        select(table.c.ports, table.c.status).where(in_row)
+    ).first()
+    if current is None:
+        return []
+    known_ports = current.ports or []
+    if scanned_ports is not None:
+        kept = [p for p in known_ports if p not in scanned_ports]
+        open_ports = sorted(set(kept) | set(open_ports))
+    events = []
+    if current.status == "offline":
+        events.append({"type": "host_online", "ip_address": ip})
+    if current.status == "offline" and HOST_UPDATE_NOTIFICATION:
+        session.add(
+            Notification(
+                ssid=ssid,
+                ip_address=ip,
+                hostname=hostname,
+                service=service,
+                message=f"Host {hostname} ({ip}) is back Online.",
+                timestamp=now,
+            )
+        )
+    session.execute(
+        update(table)
+        .where(in_row)
+        .values(
+            last_seen=now, status="online", ports=open_ports, last_port_scan=now
+        )
+    )
+    after_commit(session, lambda: device_cache.invalidate(ssid))
+    newly_discovered_ports = list(set(open_ports) - set(known_ports))
+    closed_ports = list(set(known_ports) - set(open_ports))
+    if newly_discovered_ports or closed_ports:
+        session.execute(
+            insert(PortEvent.__table__),
+            [
+                {
+                    "ssid": ssid,
+                    "ip_address": ip,
+                    "mac_address": device.mac_address,
+                    "port": port,
+                    "proto": "tcp",
+                    "state": state,
+                    "timestamp": now,
+                }
+                for ports, state in (
+                    (newly_discovered_ports, "open"),
+                    (closed_ports, "closed"),
+                )
+                for port in sorted(ports)
+            ],
+        )
+        events.append(
+            {
+                "type": "ports_changed",
+                "ip_address": ip,
+                "ports": open_ports,
+                "opened": sorted(newly_discovered_ports),
+                "closed": sorted(closed_ports),
+            }
+        )
+    after_commit(session, lambda: publish_events(ssid, events))
+    if newly_discovered_ports and PORT_DISCOVERY_NOTIFICATION:
+        session.add(
+            Notification(
+                ssid=ssid,
+                ip_address=ip,
+                hostname=hostname,
+                message=f"New Open Ports discovered: {hostname} ({ip})\n {newly_discovered_ports}",
+                timestamp=now,
+                service="Port Discovery Service",
+            )
+        )
+    if subnet_values:
+        session.execute(
+            update(Subnet.__table__)
+            .where(Subnet.ssid == ssid)
+            .values(last_activity=now, **subnet_values)
+        )
+    return newly_discovered_ports
+
+
+def advance_port_scan_cursor(session, ssid, cursor):
+    session.execute(
+        update(Subnet.__table__)
+        .where(Subnet.ssid == ssid)
+        .values(port_scan_cursor=cursor)
+    )
@@ -0,0 +1,131 @@
+import ipaddress
+import struct
+from collections import namedtuple
+
+# DNS wire format helpers shared by the unicast reverse-DNS resolver and
+# the mDNS resolver (RFC 1035, RFC 6762).
+
+TYPE_A = 1
+TYPE_PTR = 12
+TYPE_TXT = 16
+TYPE_AAAA = 28
+TYPE_SRV = 33
+TYPE_ANY = 255
+CLASS_IN = 1
+# mDNS reuses the top bit of the class: "unicast response" in questions,
+# "cache flush" in answers.
+CLASS_MASK = 0x7FFF
+UNICAST_RESPONSE = 0x8000
+
+FLAG_RESPONSE = 0x8000
+FLAG_RECURSION_DESIRED = 0x0100
+RCODE_MASK = 0x000F
+
+HEADER = struct.Struct(">HHHHHH")
+
+Record = namedtuple("Record", "name rtype rclass ttl value")
+Message = namedtuple("Message", "txid flags questions answers")
+
+
+def reverse_name(ip):
+    """
+    Returns the in-addr.arpa / ip6.arpa name for an address.
+    """
+    return ipaddress.ip_address(ip).reverse_pointer
+
+
+def encode_name(name):
+    encoded = bytearray()
+    for label in name.rstrip(".").split("."):
+        if label:
+            raw = label.encode("utf-8")
+            encoded.append(len(raw))
+            encoded += raw
+    return bytes(encoded) + b"\x00"
+
+
+def decode_name(data, offset):
+    """
+    Reads a possibly compressed name at `offset`. Returns (name, offset just
+    past the name in the original position).
+    """
+    labels, end, jumps = [], None, 0
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if jumps > 32:
+                raise ValueError("compression loop")
+            pointer = struct.unpack(">H", data[offset : offset + 2])[0] & 0x3FFF
+            if end is None:
+                end = offset + 2
+            offset, jumps = pointer, jumps + 1
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(data[offset : offset + length].decode("utf-8", "replace"))
+        offset += length
+    return ".".join(labels), end if end is not None else offset
+
+
+def build_query(txid, questions, flags=FLAG_RECURSION_DESIRED):
+    """
+    Builds a query for a list of (name, qtype) or (name, qtype, qclass).
+    """
+    packet = bytearray(HEADER.pack(txid, flags, len(questions), 0, 0, 0))
+    for question in questions:
+        name, qtype, qclass = (tuple(question) + (CLASS_IN,))[:3]
+        packet += encode_name(name) + struct.pack(">HH", qtype, qclass)
+    return bytes(packet)
+
+
+def _decode_rdata(data, offset, rtype, length):
+    if rtype == TYPE_PTR:
+        return decode_name(data, offset)[0]
+    if rtype == TYPE_A and length == 4:
+        return str(ipaddress.IPv4Address(data[offset : offset + 4]))
+    if rtype == TYPE_AAAA and length == 16:
+        return str(ipaddress.IPv6Address(data[offset : offset + 16]))
+    if rtype == TYPE_SRV:
+        priority, weight, port = struct.unpack(">HHH", data[offset : offset + 6])
+        return priority, weight, port, decode_name(data, offset + 6)[0]
+    if rtype == TYPE_TXT:
+        strings, end = [], offset + length
+        while offset < end:
+            size = data[offset]
+            strings.append(data[offset + 1 : offset + 1 + size])
+            offset += 1 + size
+        return strings
+    return data[offset : offset + length]
+
+
+def parse_message(data):
+    """
+    Parses a DNS message. Answer, authority and additional records are all
+    returned in `answers`, with PTR/A/AAAA/SRV/TXT data decoded. Raises
+    ValueError on a malformed packet.
+    """
+    try:
+        txid, flags, qdcount, ancount, nscount, arcount = HEADER.unpack_from(data)
+        offset = HEADER.size
+        questions = []
+        for _ in range(qdcount):
+            name, offset = decode_name(data, offset)
+            qtype, qclass = struct.unpack(">HH", data[offset : offset + 4])
+            questions.append((name, qtype, qclass))
+            offset += 4
+        answers = []
+        for _ in range(ancount + nscount + arcount):
+            name, offset = decode_name(data, offset)
+            rtype, rclass, ttl, length = struct.unpack(
+                ">HHIH", data[offset : offset + 10]
+            )
+            offset += 10
+            if offset + length > len(data):
+                raise ValueError("truncated record")
+            value = _decode_rdata(data, offset, rtype, length)
+            answers.append(Record(name, rtype, rclass & CLASS_MASK, ttl, value))
+            offset += length
+    except (IndexError, struct.error) as e:
+        raise ValueError(f"malformed DNS message: {e}")
+    return Message(txid, flags, questions, answers)
@@ -1,156 +1,107 @@
-from slam.db import SessionLocal
+from slam.db import submit_write
 from slam.config import version
 from slam.models import Config, Notification
-import subprocess, socket, platform, shutil, netifaces, ipaddress, time
-from sqlalchemy.exc import SQLAlchemyError, OperationalError
+from slam.netstate import network_state
+from slam.oui import lookup_vendor
+import subprocess, shutil, netifaces, threading
+from sqlalchemy.exc import SQLAlchemyError
 
 
 def get_network_info():
-    ssid, _, ip, netmask, iface, broadcast = (
-        "Unknown",
-        "Unknown",
-        "Unknown",
-        "Unknown",
-        "Unknown",
-        "Unknown",
-    )
-    system = platform.system()
-    # macOS network info
-    if system == "Darwin":
-        try:
-            output = (
-                subprocess.check_output(
-                    "ipconfig getsummary en0 | awk -F ' SSID : ' '/ SSID : / {print $2}'",
-                    shell=True,
-                )
-                .decode()
-                .strip()
-            )
-
-            ssid = output if output else "Unknown"
-        except Exception:
-            ssid = "Unknown"
-    # Linux network info
-    elif system == "Linux":
-        try:
-            output = subprocess.check_output("iwgetid -r", shell=True).decode().strip()
+    return network_state.get()
 
-            ssid = output if output else "Unknown"
-        except Exception:
-            ssid = "Unknown"
 
-    # Get IP address, netmask, and broadcast information using netifaces
-    try:
-        iface = netifaces.gateways()["default"][netifaces.AF_INET][1]
-        addr_info = netifaces.ifaddresses(iface)[netifaces.AF_INET][0]
-        ip = addr_info["addr"]
-        netmask = addr_info["netmask"]
-        broadcast = addr_info.get("broadcast", "Unknown")
-    except Exception:
-        ip = "192.168.0.1"
-        netmask = "255.255.255.255"
-        broadcast = "Unknown"
+def _update_configurations(session, new_config_values):
+    config = session.query(Config).first()
+    if not config:
+        raise ValueError("Configuration row does not exist.")
+    for key, value in new_config_values.items():
+        if hasattr(config, key):
+            setattr(config, key, value)
 
-    def netmask_to_cidr(ip, mask):
-        network = ipaddress.IPv4Network(f"{ip}/{mask}", strict=False)
-        return f"{network.network_address}/{network.prefixlen}"
 
-    cidr = netmask_to_cidr(ip, netmask)
-
-    return ssid, cidr, ip, netmask, iface, broadcast
+def update_configurations(new_config_values):
+    submit_write(_update_configurations, new_config_values).result()
 
 
-def update_configurations(new_config_values):
-    session = SessionLocal()
-    try:
-        config = session.query(Config).first()
-        if config:
-            for key, value in new_config_values.items():
-                if hasattr(config, key):
-                    setattr(config, key, value)
-            session.commit()
-        else:
-            raise ValueError("Configuration row does not exist.")
-
-    except Exception as e:
-        session.rollback()
-        raise e
-    finally:
-        session.close()
-
-
-def get_device_info(ip):
-    info = {"IP": ip, "MAC": "Unknown", "Vendor": "Unknown", "Hostname": "Unknown"}
-    iface = netifaces.gateways()["default"][netifaces.AF_INET][1]
+def get_subnet_neighbors(subnet, iface=None):
+    """
+    Builds an {ip: (mac, vendor)} table for a whole subnet with a single
+    arp-scan run.
+    """
+    neighbors = {}
     if shutil.which("arp-scan"):
         try:
+            if iface is None:
+                iface = netifaces.gateways()["default"][netifaces.AF_INET][1]
             out = subprocess.run(
-                ["arp-scan", ip, "-x", "-d", "-I", f"{iface}"],
+                ["arp-scan", subnet, "-x", "-d", "-I", f"{iface}"],
                 capture_output=True,
                 text=True,
                 check=True,
             ).stdout
             for line in out.splitlines():
-                if ip in line:
-                    parts = line.split("\t")
-                    if len(parts) >= 3:
-                        info["MAC"], info["Vendor"] = parts[1], parts[2]
-        except:
-            pass
+                parts = line.split("\t")
+                if len(parts) >= 3:
+                    neighbors[parts[0]] = (parts[1], parts[2])
+        except Exception as e:
+            print(f"[-] arp-scan over {subnet} failed: {e}")
+
+    return neighbors
 
-    try:
-        info["Hostname"] = socket.gethostbyaddr(ip)[0]
-        print(f"[+] Host by Socket {socket.gethostbyaddr(ip)[0]}")
-    except:
-        pass
 
+class SweepNeighbors:
+    """
+    Per-sweep MAC/vendor lookup table. The subnet-wide arp-scan only runs the
+    first time a host turns up that nmap reported without a MAC.
+    """
+
+    def __init__(self, subnet, iface=None):
+        self.subnet = subnet
+        self.iface = iface
+        self._table = None
+        self._lock = threading.Lock()
+
+    def lookup(self, ip):
+        with self._lock:
+            if self._table is None:
+                self._table = get_subnet_neighbors(self.subnet, self.iface)
+        return self._table.get(ip)
+
+
+def get_device_info(ip, host=None, neighbors=None):
+    info = {"IP": ip, "MAC": "Unknown", "Vendor": "Unknown", "Hostname": "Unknown"}
+    mac = (host or {}).get("addresses", {}).get("mac")
+    if mac:
+        info["MAC"] = mac
+        info["Vendor"] = host.get("vendor", {}).get(mac, "Unknown")
+    elif neighbors is not None:
+        entry = neighbors.lookup(ip)
+        if entry:
+            info["MAC"], info["Vendor"] = entry
+    if info["MAC"] != "Unknown" and (
+        not info["Vendor"]
+        or info["Vendor"] == "Unknown"
+        or info["Vendor"].startswith("(Unknown")
+    ):
+        info["Vendor"] = lookup_vendor(info["MAC"]) or "Unknown"
     return info
 
 
+def _mark_notifications_read(session):
+    return session.query(Notification).filter_by(read=False).update({"read": True})
+
+
 def read_notifications():
-    retry_attempts, retry_delay = 5, 3
-    for attempt in range(retry_attempts):
-        try:
-            session = SessionLocal()
-            session.query(Notification).filter_by(read=False).update({"read": True})
-            session.commit()
-            break
-        except OperationalError as oe:
-            if "locked" in str(oe).lower():
-                print(
-                    f"DB Lock detected in Notifications. Retrying... ({attempt + 1}/{retry_attempts})"
-                )
-                session.rollback()
-                time.sleep(retry_delay)
-            else:
-                print(f"DB Error in UPDATER: {oe}")
-                session.rollback()
-                break
-
-        except SQLAlchemyError as e:
-            print("DB Error in UPDATER:", e)
-            session.rollback()
-            break
-        finally:
-            session.close()
+    try:
+        return submit_write(_mark_notifications_read).result()
+    except SQLAlchemyError as e:
+        print("DB Error in UPDATER:", e)
+        return 0
 
 
 def get_ssid():
-    ssid = "Unknown"
-    try:
-        output = (
-            subprocess.check_output(
-                "ipconfig getsummary en0 | awk -F ' SSID : ' '/ SSID : / {print $2}'",
-                shell=True,
-            )
-            .decode()
-            .strip()
-        )
-        if output:
-            ssid = output
-    except Exception:
-        ssid = "Unknown"
-    return ssid
+    return network_state.ssid
 
 
 def check_dependency():
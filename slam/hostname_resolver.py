@@ -0,0 +1,289 @@
+import asyncio
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from slam.db import SessionLocal, submit_write
+from slam.models import HostnameCacheEntry
+from slam.dns_wire import (
+    build_query,
+    parse_message,
+    reverse_name,
+    TYPE_PTR,
+    FLAG_RESPONSE,
+)
+from slam.mdns_resolver import resolve_hostname as resolve_mdns_hostname
+from slam.lookup_batcher import LookupBatcher
+from slam.config import (
+    ENRICHMENT_HOST_TIMEOUT,
+    HOSTNAME_DNS_TIMEOUT,
+    HOSTNAME_CACHE_SIZE,
+    HOSTNAME_CACHE_TTL,
+    HOSTNAME_NEGATIVE_TTL,
+)
+
+RESOLV_CONF = "/etc/resolv.conf"
+DNS_PORT = 53
+
+
+def get_scanner_hostname(host):
+    for hostname in host.get("hostnames", []):
+        if hostname.get("name"):
+            return hostname["name"]
+    return None
+
+
+def _nameservers():
+    servers = []
+    try:
+        with open(RESOLV_CONF) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 2 or parts[0] != "nameserver" or ":" in parts[1]:
+                    continue
+                servers.append(parts[1])
+    except OSError:
+        pass
+    return servers[:3] or ["127.0.0.1"]
+
+
+class _PtrProtocol(asyncio.DatagramProtocol):
+    def __init__(self, pending, results, done):
+        self.pending = pending
+        self.results = results
+        self.done = done
+
+    def datagram_received(self, data, addr):
+        try:
+            message = parse_message(data)
+        except ValueError:
+            return
+        ip = self.pending.get(message.txid)
+        if ip is None or not message.flags & FLAG_RESPONSE:
+            return
+        if not message.questions or message.questions[0][0].lower() != reverse_name(
+            ip
+        ):
+            return
+        names = [r.value for r in message.answers if r.rtype == TYPE_PTR]
+        self.results[ip] = names[0].rstrip(".") if names else None
+        del self.pending[message.txid]
+        if not self.pending:
+            self.done.set()
+
+    def error_received(self, exc):
+        pass
+
+
+async def query_ptr(ips, timeout=HOSTNAME_DNS_TIMEOUT, servers=None, port=DNS_PORT):
+    """
+    Sends PTR queries for every IP from one UDP socket to the resolv.conf
+    nameservers and collects answers until all are in or the shared deadline
+    passes; unanswered queries are retried against the next nameserver.
+    Returns {ip: hostname or None}.
+    """
+    results = {ip: None for ip in ips}
+    if not ips:
+        return results
+    servers = servers or _nameservers()
+    loop = asyncio.get_running_loop()
+    base = random.randint(0, 0xFFFF)
+    pending = {(base + i) & 0xFFFF: ip for i, ip in enumerate(results)}
+    done = asyncio.Event()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _PtrProtocol(pending, results, done), local_addr=("0.0.0.0", 0)
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        rounds = max(len(servers), 2)
+        for attempt in range(rounds):
+            server = servers[attempt % len(servers)]
+            for txid, ip in list(pending.items()):
+                query = build_query(txid, [(reverse_name(ip), TYPE_PTR)])
+                try:
+                    transport.sendto(query, (server, port))
+                except OSError:
+                    pass
+            wait = (deadline - time.monotonic()) / (rounds - attempt)
+            try:
+                await asyncio.wait_for(done.wait(), timeout=max(wait, 0))
+                break
+            except asyncio.TimeoutError:
+                continue
+    finally:
+        transport.close()
+    return results
+
+
+def get_ptr_names(ips, timeout=HOSTNAME_DNS_TIMEOUT):
+    try:
+        return asyncio.run(query_ptr(list(ips), timeout=timeout))
+    except Exception as e:
+        print(f"[-] Reverse DNS query failed: {e}")
+        return {ip: None for ip in ips}
+
+
+class ReverseDNSBatcher(LookupBatcher):
+    """
+    Batches reverse-DNS lookups, so a sweep's PTR queries share one socket
+    and deadline.
+    """
+
+    def __init__(self, window=0.25, timeout=HOSTNAME_DNS_TIMEOUT):
+        super().__init__(window=window, timeout=timeout)
+
+    def resolve(self, ips):
+        return get_ptr_names(ips, timeout=self.timeout)
+
+
+def _store_hostname(session, mac, ip, hostname, source, expires_at):
+    stmt = sqlite_insert(HostnameCacheEntry).values(
+        mac_address=mac,
+        ip_address=ip,
+        hostname=hostname,
+        source=source,
+        expires_at=expires_at,
+    )
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["mac_address", "ip_address"],
+            set_={
+                "hostname": stmt.excluded.hostname,
+                "source": stmt.excluded.source,
+                "expires_at": stmt.excluded.expires_at,
+            },
+        )
+    )
+
+
+def _prune_hostnames(session, now):
+    session.execute(
+        delete(HostnameCacheEntry).where(HostnameCacheEntry.expires_at < now)
+    )
+
+
+class HostnameCache:
+    """
+    LRU of resolved hostnames keyed by (MAC, IP), so a device that moves to
+    another address or an address reused by another device is resolved
+    again. Failures are cached as "Unknown" for the shorter negative TTL.
+    Entries are written through to the hostname_cache table and loaded back
+    on first use, so a restart starts warm.
+    """
+
+    def __init__(self, size=HOSTNAME_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self):
+        now = datetime.now()
+        session = SessionLocal()
+        try:
+            rows = (
+                session.query(HostnameCacheEntry)
+                .filter(HostnameCacheEntry.expires_at > now)
+                .order_by(HostnameCacheEntry.expires_at.desc())
+                .limit(self.size)
+                .all()
+            )
+        finally:
+            session.close()
+        for row in reversed(rows):
+            key = (row.mac_address, row.ip_address)
+            self._entries[key] = (row.hostname, row.expires_at)
+        submit_write(_prune_hostnames, now)
+
+    def get(self, mac, ip):
+        key = ((mac or "Unknown").lower(), ip)
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                try:
+                    self._load()
+                except Exception as e:
+                    print(f"[-] Could not load hostname cache: {e}")
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= datetime.now():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, mac, ip, hostname, source=None):
+        key = ((mac or "Unknown").lower(), ip)
+        ttl = HOSTNAME_CACHE_TTL if hostname != "Unknown" else HOSTNAME_NEGATIVE_TTL
+        expires_at = datetime.now() + timedelta(seconds=ttl)
+        with self._lock:
+            self._entries[key] = (hostname, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        submit_write(_store_hostname, key[0], ip, hostname, source, expires_at)
+
+
+hostname_cache = HostnameCache()
+
+
+def resolve_host_name(
+    ip,
+    mac,
+    host=None,
+    ptr=None,
+    netbios=None,
+    mdns=None,
+    timeout=ENRICHMENT_HOST_TIMEOUT,
+):
+    """
+    Resolves a hostname through one chain: the name nmap already reported,
+    the cache, reverse DNS, NetBIOS and mDNS. `ptr`, `netbios` and `mdns`
+    are batchers; all are queried at once on a cache miss and read in order,
+    each within its own timeout and the overall deadline. Returns
+    (hostname, source), with "Unknown" when nothing answered.
+    """
+    hostname = get_scanner_hostname(host or {})
+    if hostname:
+        if hostname_cache.get(mac, ip) != hostname:
+            hostname_cache.put(mac, ip, hostname, "nmap")
+        return hostname, "nmap"
+
+    cached = hostname_cache.get(mac, ip)
+    if cached is not None:
+        return cached, "cache"
+    deadline = time.monotonic() + timeout
+
+    lookups = []
+    if ptr is not None:
+        lookups.append(("dns", ptr.lookup(ip), ptr.window + ptr.timeout))
+    if netbios is not None:
+        lookups.append(("netbios", netbios.lookup(ip), netbios.window + netbios.timeout))
+    if mdns is not None:
+        lookups.append(("mdns", mdns.lookup(ip), mdns.window + mdns.timeout))
+    for source, future, source_timeout in lookups:
+        wait = min(source_timeout, deadline - time.monotonic())
+        if wait <= 0:
+            break
+        try:
+            result = future.result(timeout=wait)
+        except Exception:
+            continue
+        if source == "netbios":
+            result = result.get("netbios_name")
+        if result and result != "Unknown":
+            hostname_cache.put(mac, ip, result, source)
+            return result, source
+
+    if time.monotonic() < deadline:
+        hostname = resolve_mdns_hostname(ip)
+        if hostname and hostname != "Unknown":
+            hostname_cache.put(mac, ip, hostname, "mdns")
+            return hostname, "mdns"
+
+    hostname_cache.put(mac, ip, "Unknown")
+    return "Unknown", None
@@ -0,0 +1,55 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+class LookupBatcher:
+    """
+    Coalesces per-IP lookups that arrive within `window` seconds into one
+    call to resolve(), so hosts streamed in from nmap one by one still share
+    a socket and a deadline. Subclasses implement resolve(ips), returning
+    {ip: result}; lookup() hands out a Future per IP.
+    """
+
+    def __init__(self, window=0.25, timeout=2):
+        self.window = window
+        self.timeout = timeout
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def lookup(self, ip):
+        with self._lock:
+            future = self._pending.get(ip)
+            if future is None:
+                future = self._pending[ip] = Future()
+            self._wake.set()
+        return future
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+
+    def resolve(self, ips):
+        raise NotImplementedError
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.window)
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._wake.clear()
+            if batch:
+                try:
+                    results = self.resolve(list(batch))
+                except Exception as e:
+                    for future in batch.values():
+                        future.set_exception(e)
+                else:
+                    for ip, future in batch.items():
+                        future.set_result(results.get(ip))
+            if self._closed:
+                return
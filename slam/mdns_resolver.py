@@ -1,7 +1,30 @@
+import asyncio
+import ipaddress
+import random
 import socket
 import threading
-from zeroconf import Zeroconf, ServiceBrowser
+import time
+from collections import OrderedDict
+from zeroconf import (
+    Zeroconf,
+    ServiceBrowser,
+    ServiceInfo,
+    DNSAddress,
+    current_time_millis,
+)
 from zeroconf._exceptions import BadTypeInNameException
+from slam.dns_wire import build_query, parse_message, reverse_name, TYPE_PTR
+from slam.lookup_batcher import LookupBatcher
+from slam.config import (
+    MDNS_TIMEOUT,
+    MDNS_SERVICE_TIMEOUT,
+    MDNS_CACHE_SIZE,
+)
+
+MDNS_GROUP = "224.0.0.251"
+MDNS_PORT = 5353
+# Keeps each query in one unfragmented datagram.
+MAX_QUESTIONS = 24
 
 
 SERVICE_TYPES = list(
@@ -44,25 +67,70 @@ SERVICE_TYPES = list(
 )
 
 
-_hostname_cache = {}
+# ip -> (hostname, expiry on the monotonic clock), least recently used first.
+_hostname_cache = OrderedDict()
 _hostname_lock = threading.Lock()
+_init_lock = threading.Lock()
 _initialized = False
 _zeroconf = None
 _browsers = []
 
 
+def _remember(ip, hostname, ttl):
+    with _hostname_lock:
+        _hostname_cache[ip] = (hostname.rstrip("."), time.monotonic() + ttl)
+        _hostname_cache.move_to_end(ip)
+        while len(_hostname_cache) > MDNS_CACHE_SIZE:
+            _hostname_cache.popitem(last=False)
+
+
+def _cached(ip):
+    with _hostname_lock:
+        entry = _hostname_cache.get(ip)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del _hostname_cache[ip]
+            return None
+        _hostname_cache.move_to_end(ip)
+        return entry[0]
+
+
+def _address_ttl(zeroconf, info):
+    now = current_time_millis()
+    ttls = [
+        record.get_remaining_ttl(now)
+        for record in zeroconf.cache.async_entries_with_name(info.server)
+        if isinstance(record, DNSAddress)
+    ]
+    return min(ttls) if ttls else info.host_ttl
+
+
+async def _resolve_service(zeroconf, type_, name):
+    info = ServiceInfo(type_, name)
+    try:
+        if not await info.async_request(zeroconf, MDNS_SERVICE_TIMEOUT * 1000):
+            return
+    except BadTypeInNameException:
+        return
+    if not info.server:
+        return
+    ttl = _address_ttl(zeroconf, info)
+    for ip in info.parsed_addresses():
+        _remember(ip, info.server, ttl)
+
+
 class CachingListener:
+    """
+    Resolves announced services on zeroconf's own event loop, so browser
+    callbacks never block, and caches every address of the host.
+    """
+
     def add_service(self, zeroconf, type_, name):
         try:
-            info = zeroconf.get_service_info(type_, name)
-            if info and info.addresses:
-                ip = socket.inet_ntoa(info.addresses[0])
-                hostname = info.server
-
-                with _hostname_lock:
-                    _hostname_cache[ip] = hostname
-        except BadTypeInNameException:
-            pass
+            asyncio.run_coroutine_threadsafe(
+                _resolve_service(zeroconf, type_, name), zeroconf.loop
+            )
         except Exception:
             pass
 
@@ -78,7 +146,7 @@ def _initialize():
     if _initialized:
         return
 
-    with threading.Lock():
+    with _init_lock:
         if _initialized:
             return
 
@@ -93,14 +161,112 @@ def _initialize():
         _initialized = True
 
 
+class _MulticastPtrProtocol(asyncio.DatagramProtocol):
+    def __init__(self, names, results, done):
+        self.names = names
+        self.results = results
+        self.done = done
+
+    def datagram_received(self, data, addr):
+        try:
+            message = parse_message(data)
+        except ValueError:
+            return
+        for record in message.answers:
+            ip = self.names.get(record.name.lower())
+            if ip is None or record.rtype != TYPE_PTR or record.ttl == 0:
+                continue
+            if self.results.get(ip) is None:
+                self.results[ip] = record.value.rstrip(".")
+            _remember(ip, record.value, record.ttl)
+        if all(self.results[ip] for ip in self.names.values()):
+            self.done.set()
+
+    def error_received(self, exc):
+        pass
+
+
+async def query_mdns_ptr(ips, timeout=MDNS_TIMEOUT):
+    """
+    Asks the link for the reverse names of IPv4 addresses with one-shot
+    multicast PTR queries (RFC 6762 section 5.1), packing several questions
+    per datagram. Answers arrive unicast on our own socket; collection stops
+    when every address is answered or the deadline passes. The queries are
+    repeated once halfway through in case a datagram was lost.
+    Returns {ip: hostname or None}.
+    """
+    results = {ip: None for ip in ips}
+    names = {
+        reverse_name(ip): ip
+        for ip in results
+        if ipaddress.ip_address(ip).version == 4
+    }
+    if not names:
+        return results
+    loop = asyncio.get_running_loop()
+    done = asyncio.Event()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 255)
+    sock.bind(("0.0.0.0", 0))
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _MulticastPtrProtocol(names, results, done), sock=sock
+    )
+    questions = [(name, TYPE_PTR) for name in names]
+    try:
+        for attempt in range(2):
+            for start in range(0, len(questions), MAX_QUESTIONS):
+                pending = [
+                    (name, qtype)
+                    for name, qtype in questions[start : start + MAX_QUESTIONS]
+                    if results[names[name]] is None
+                ]
+                if not pending:
+                    continue
+                query = build_query(random.randint(0, 0xFFFF), pending, flags=0)
+                try:
+                    transport.sendto(query, (MDNS_GROUP, MDNS_PORT))
+                except OSError:
+                    pass
+            try:
+                await asyncio.wait_for(done.wait(), timeout=timeout / 2)
+                break
+            except asyncio.TimeoutError:
+                continue
+    finally:
+        transport.close()
+    return results
+
+
+def get_mdns_names(ips, timeout=MDNS_TIMEOUT):
+    names = {ip: _cached(ip) for ip in ips}
+    missing = [ip for ip, name in names.items() if name is None]
+    if missing:
+        try:
+            names.update(asyncio.run(query_mdns_ptr(missing, timeout=timeout)))
+        except Exception as e:
+            print(f"[-] mDNS query failed: {e}")
+    return names
+
+
+class MulticastPtrBatcher(LookupBatcher):
+    """
+    Coalesces the reverse-mDNS lookups of a sweep into shared multicast
+    queries with one deadline.
+    """
+
+    def __init__(self, window=0.25, timeout=MDNS_TIMEOUT):
+        super().__init__(window=window, timeout=timeout)
+
+    def resolve(self, ips):
+        return get_mdns_names(ips, timeout=self.timeout)
+
+
 def resolve_hostname(ip):
     """
     Returns mDNS hostname for an IP if discovered; otherwise 'Unknown'.
     """
     _initialize()
-
-    with _hostname_lock:
-        return _hostname_cache.get(ip, "Unknown")
+    return _cached(ip) or "Unknown"
 
 
 def close_zeroconf():
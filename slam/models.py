@@ -3,8 +3,12 @@ from sqlalchemy import (
     Integer,
     String,
     DateTime,
-    Table,
+    Date,
+    LargeBinary,
     Boolean,
+    Index,
+    ForeignKey,
+    select,
 )
 from sqlalchemy.orm import declarative_base
 from datetime import datetime
@@ -24,28 +28,51 @@ class Subnet(Base):
     netmask = Column(String)
     iface = Column(String)
     broadcast = Column(String)
+    # First port of the next slice in rotating port scan mode.
+    port_scan_cursor = Column(Integer, default=1)
 
 
-def get_device_table(ssid):
-    table_name = f"devices_{ssid.replace('-', '_').replace('.', '_')}"
-    return Table(
-        table_name,
-        Base.metadata,
-        Column("id", Integer, primary_key=True),
-        Column("ip_address", String),
-        Column("hostname", String),
-        Column("vendor", String),
-        Column("mac_address", String),
-        Column("status", String),
-        Column("first_seen", DateTime),
-        Column("last_seen", DateTime),
-        Column("ports", JSON),
-        extend_existing=True,
+class Device(Base):
+    """
+    Devices of every network, partitioned by subnet_id. Each index leads
+    with subnet_id, so per-network queries stay as cheap as they were with
+    a table per network.
+    """
+
+    __tablename__ = "devices"
+    __table_args__ = (
+        Index("ux_devices_subnet_ip_address", "subnet_id", "ip_address", unique=True),
+        Index("ix_devices_subnet_mac_address", "subnet_id", "mac_address"),
+        Index("ix_devices_subnet_status", "subnet_id", "status"),
+    )
+    id = Column(Integer, primary_key=True)
+    subnet_id = Column(Integer, ForeignKey("subnets.id"), nullable=False)
+    ip_address = Column(String)
+    hostname = Column(String)
+    vendor = Column(String)
+    mac_address = Column(String)
+    status = Column(String)
+    first_seen = Column(DateTime)
+    last_seen = Column(DateTime)
+    ports = Column(JSON)
+    last_port_scan = Column(DateTime)
+
+
+def subnet_devices(ssid):
+    """
+    Filter selecting the devices of the network with this SSID.
+    """
+    return Device.subnet_id == (
+        select(Subnet.id).where(Subnet.ssid == ssid).scalar_subquery()
     )
 
 
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (
+        Index("ix_notifications_ssid_timestamp", "ssid", "timestamp"),
+        Index("ix_notifications_read_timestamp", "read", "timestamp"),
+    )
     id = Column(Integer, primary_key=True)
     ssid = Column(String)
     ip_address = Column(String)
@@ -53,7 +80,57 @@ class Notification(Base):
     message = Column(String)
     service = Column(String)
     read = Column(Boolean, default=False)
-    timestamp = Column(DateTime, default=datetime.now)
+    timestamp = Column(DateTime, default=datetime.now, index=True)
+
+
+class HostnameCacheEntry(Base):
+    __tablename__ = "hostname_cache"
+    mac_address = Column(String, primary_key=True)
+    ip_address = Column(String, primary_key=True)
+    hostname = Column(String)
+    source = Column(String)
+    expires_at = Column(DateTime, index=True)
+
+
+class PresenceDay(Base):
+    """
+    One host's presence on one day as two bitmaps of PRESENCE_SLOT_MINUTES
+    slots: whether the host's state was observed in the slot, and whether it
+    was online.
+    """
+
+    __tablename__ = "presence_history"
+    # Clustered on (ssid, day, ip_address), so a report reads one contiguous
+    # range of the table.
+    __table_args__ = {"sqlite_with_rowid": False}
+    ssid = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    ip_address = Column(String, primary_key=True)
+    observed = Column(LargeBinary)
+    online = Column(LargeBinary)
+
+
+class PortEvent(Base):
+    """
+    Append-only log of port state changes: one row each time a scan finds a
+    port opened or closed on a host.
+    """
+
+    __tablename__ = "port_events"
+    __table_args__ = (
+        # When did port X first appear on host Y.
+        Index("ix_port_events_host_port", "ssid", "ip_address", "port", "timestamp"),
+        # Which hosts exposed port Z at time T.
+        Index("ix_port_events_port_host", "ssid", "port", "ip_address", "timestamp"),
+    )
+    id = Column(Integer, primary_key=True)
+    ssid = Column(String, nullable=False)
+    ip_address = Column(String, nullable=False)
+    mac_address = Column(String)
+    port = Column(Integer, nullable=False)
+    proto = Column(String, default="tcp", nullable=False)
+    state = Column(String, nullable=False)
+    timestamp = Column(DateTime, default=datetime.now, nullable=False)
 
 
 class Config(Base):
@@ -1,39 +1,184 @@
-import subprocess
-import xml.etree.ElementTree as ET
+import asyncio
+import random
+import struct
+import time
+from slam.lookup_batcher import LookupBatcher
+from slam.config import NBNS_TIMEOUT
 
+NBNS_PORT = 137
+NBSTAT_TYPE = 0x21
+NBSTAT_CLASS = 0x01
+GROUP_NAME_FLAG = 0x8000
 
-def get_nbtstat_name(ip):
-    cmd = ["nmap", "--script", "nbstat", "-oX", "-", ip]
-    device_info = {
+
+def _unknown_info(ip):
+    return {
         "ip": ip,
         "netbios_name": "Unknown",
         "netbios_user": "Unknown",
         "netbios_mac": "Unknown",
         "workgroup": "Unknown",
     }
-    nbtname = ""
+
+
+def _encode_name(name=b"*"):
+    padded = name.ljust(16, b"\x00")
+    encoded = bytearray()
+    for byte in padded:
+        encoded.append((byte >> 4) + 0x41)
+        encoded.append((byte & 0x0F) + 0x41)
+    return b"\x20" + bytes(encoded) + b"\x00"
+
+
+def build_node_status_query(txid):
+    header = struct.pack(">HHHHHH", txid, 0x0000, 1, 0, 0, 0)
+    return header + _encode_name() + struct.pack(">HH", NBSTAT_TYPE, NBSTAT_CLASS)
+
+
+def _skip_name(data, offset):
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        if length == 0:
+            return offset + 1
+        offset += length + 1
+
+
+def parse_node_status_response(data, ip):
+    """
+    Parses an NBSTAT reply into the same fields the nmap nbstat script reports.
+    Returns (txid, info); raises ValueError on a malformed packet.
+    """
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-        if result.returncode != 0:
-            raise RuntimeError(f"Nmap failed: {result.stderr}")
-        root = ET.fromstring(result.stdout)
-
-        for script in root.findall(".//hostscript/script"):
-            sid = script.attrib.get("id", "")
-            output = script.attrib.get("output", "")
-
-            if sid == "nbstat":
-                for line in output.splitlines():
-                    if line.startswith("NetBIOS name:"):
-                        device_info["netbios_name"] = line.split(":", 1)[1].strip()
-                        nbtname = line.split(":", 1)[1].strip()
-                    elif line.startswith("NetBIOS user:"):
-                        device_info["netbios_user"] = line.split(":", 1)[1].strip()
-                    elif line.startswith("NetBIOS MAC:"):
-                        device_info["netbios_mac"] = line.split(":", 1)[1].strip()
-                    elif "Workgroup:" in line:
-                        device_info["workgroup"] = line.split(":", 1)[1].strip()
-
-        return nbtname.split(",")[0]
-    except Exception:
-        return "Unknown"
+        txid, flags, _, ancount = struct.unpack(">HHHH", data[:8])
+        if not flags & 0x8000 or ancount < 1:
+            raise ValueError("not a node status answer")
+        offset = _skip_name(data, 12)
+        rtype, _, _, rdlength = struct.unpack(">HHIH", data[offset : offset + 10])
+        if rtype != NBSTAT_TYPE:
+            raise ValueError("unexpected record type")
+        offset += 10
+        rdata = data[offset : offset + rdlength]
+        num_names = rdata[0]
+        names = []
+        for i in range(num_names):
+            entry = rdata[1 + i * 18 : 19 + i * 18]
+            if len(entry) < 18:
+                raise ValueError("truncated name table")
+            name = entry[:15].decode("ascii", errors="replace").rstrip(" \x00")
+            names.append((name, entry[15], struct.unpack(">H", entry[16:18])[0]))
+        mac = rdata[1 + num_names * 18 : 7 + num_names * 18]
+    except (IndexError, struct.error) as e:
+        raise ValueError(f"malformed node status answer: {e}")
+
+    info = _unknown_info(ip)
+    unique = [(n, s) for n, s, f in names if not f & GROUP_NAME_FLAG]
+    groups = [(n, s) for n, s, f in names if f & GROUP_NAME_FLAG]
+
+    # Same preference as nmap: the file server name, then the workstation name.
+    server = [n for n, s in unique if s == 0x20] or [
+        n for n, s in unique if s == 0x00
+    ]
+    if server:
+        info["netbios_name"] = server[0]
+    users = [n for n, s in unique if s == 0x03 and n != info["netbios_name"]]
+    if users:
+        info["netbios_user"] = users[0]
+    workgroups = [n for n, s in groups if s == 0x00]
+    if workgroups:
+        info["workgroup"] = workgroups[0]
+    if len(mac) == 6 and any(mac):
+        info["netbios_mac"] = ":".join(f"{b:02x}" for b in mac)
+    return txid, info
+
+
+class _NodeStatusProtocol(asyncio.DatagramProtocol):
+    def __init__(self, pending, results, done):
+        self.pending = pending
+        self.results = results
+        self.done = done
+
+    def datagram_received(self, data, addr):
+        ip = addr[0]
+        if ip not in self.pending:
+            return
+        try:
+            txid, info = parse_node_status_response(data, ip)
+        except ValueError:
+            return
+        if txid != self.pending[ip]:
+            return
+        self.results[ip] = info
+        del self.pending[ip]
+        if not self.pending:
+            self.done.set()
+
+    def error_received(self, exc):
+        pass
+
+
+async def query_node_status(ips, timeout=NBNS_TIMEOUT, port=NBNS_PORT, retries=1):
+    """
+    Sends NBSTAT queries to every IP from one UDP socket and collects the
+    replies until all have answered or the shared deadline passes. Hosts that
+    stay silent are retransmitted to `retries` times within the deadline.
+    """
+    results = {ip: _unknown_info(ip) for ip in ips}
+    if not ips:
+        return results
+
+    loop = asyncio.get_running_loop()
+    base = random.randint(0, 0xFFFF)
+    pending = {ip: (base + i) & 0xFFFF for i, ip in enumerate(results)}
+    done = asyncio.Event()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _NodeStatusProtocol(pending, results, done),
+        local_addr=("0.0.0.0", 0),
+        allow_broadcast=True,
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        rounds = retries + 1
+        for attempt in range(rounds):
+            for ip, txid in list(pending.items()):
+                try:
+                    transport.sendto(build_node_status_query(txid), (ip, port))
+                except OSError:
+                    pass
+            remaining = deadline - time.monotonic()
+            wait = remaining / (rounds - attempt)
+            try:
+                await asyncio.wait_for(done.wait(), timeout=max(wait, 0))
+                break
+            except asyncio.TimeoutError:
+                continue
+    finally:
+        transport.close()
+
+    return results
+
+
+def get_nbtstat_names(ips, timeout=NBNS_TIMEOUT, port=NBNS_PORT):
+    try:
+        return asyncio.run(query_node_status(list(ips), timeout=timeout, port=port))
+    except Exception as e:
+        print(f"[-] NetBIOS node status query failed: {e}")
+        return {ip: _unknown_info(ip) for ip in ips}
+
+
+def get_nbtstat_name(ip, timeout=NBNS_TIMEOUT):
+    return get_nbtstat_names([ip], timeout=timeout)[ip]["netbios_name"]
+
+
+class NodeStatusBatcher(LookupBatcher):
+    """
+    Batches NetBIOS node-status lookups into shared get_nbtstat_names()
+    queries.
+    """
+
+    def __init__(self, window=0.25, timeout=NBNS_TIMEOUT):
+        super().__init__(window=window, timeout=timeout)
+
+    def resolve(self, ips):
+        return get_nbtstat_names(ips, timeout=self.timeout)
@@ -0,0 +1,126 @@
+import os
+import socket
+import struct
+
+# rtnetlink neighbour messages (linux/rtnetlink.h, linux/neighbour.h)
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWNEIGH = 28
+RTM_GETNEIGH = 30
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NDA_DST = 1
+NDA_LLADDR = 2
+
+NUD_INCOMPLETE = 0x01
+NUD_REACHABLE = 0x02
+NUD_STALE = 0x04
+NUD_DELAY = 0x08
+NUD_PROBE = 0x10
+NUD_FAILED = 0x20
+NUD_NOARP = 0x40
+NUD_PERMANENT = 0x80
+
+# Entries the kernel has confirmed recently enough to trust without a probe.
+NUD_FRESH = NUD_REACHABLE | NUD_PERMANENT
+# Entries that were valid once but need a probe to confirm.
+NUD_EXPIRED = NUD_STALE | NUD_DELAY | NUD_PROBE
+
+PROC_NET_ARP = "/proc/net/arp"
+ATF_COM = 0x2
+
+
+def _format_mac(raw):
+    return ":".join(f"{b:02x}" for b in raw)
+
+
+def _parse_neighbor(payload):
+    family, ifindex, state = struct.unpack("=B3xiH", payload[:10])
+    if family != socket.AF_INET:
+        return None
+    ip = mac = None
+    offset = 12
+    while offset + 4 <= len(payload):
+        length, kind = struct.unpack("=HH", payload[offset : offset + 4])
+        if length < 4:
+            break
+        value = payload[offset + 4 : offset + length]
+        if kind == NDA_DST and len(value) == 4:
+            ip = socket.inet_ntoa(value)
+        elif kind == NDA_LLADDR and len(value) == 6:
+            mac = _format_mac(value)
+        offset += (length + 3) & ~3
+    if ip is None:
+        return None
+    return ip, mac, state, ifindex
+
+
+def _dump_netlink():
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+    try:
+        sock.settimeout(1)
+        ndmsg = struct.pack("=B3xiHBB", socket.AF_INET, 0, 0, 0, 0)
+        header = struct.pack(
+            "=IHHII", 16 + len(ndmsg), RTM_GETNEIGH, NLM_F_REQUEST | NLM_F_DUMP, 1, 0
+        )
+        sock.send(header + ndmsg)
+        entries = {}
+        while True:
+            data = sock.recv(65536)
+            offset = 0
+            while offset + 16 <= len(data):
+                header = data[offset : offset + 16]
+                length, kind, _, _, _ = struct.unpack("=IHHII", header)
+                if kind == NLMSG_DONE:
+                    return entries
+                if kind == NLMSG_ERROR:
+                    raise OSError("netlink neighbour dump failed")
+                if kind == RTM_NEWNEIGH:
+                    entry = _parse_neighbor(data[offset + 16 : offset + length])
+                    if entry:
+                        ip, mac, state, ifindex = entry
+                        try:
+                            iface = socket.if_indextoname(ifindex)
+                        except OSError:
+                            iface = None
+                        entries[ip] = (mac, state, iface)
+                if length == 0:
+                    break
+                offset += (length + 3) & ~3
+    finally:
+        sock.close()
+
+
+def _read_proc_arp():
+    # /proc/net/arp has no NUD state; a completed entry may be stale, so it
+    # is reported as such and gets probed.
+    entries = {}
+    with open(PROC_NET_ARP) as f:
+        next(f)
+        for line in f:
+            parts = line.split()
+            if len(parts) < 6:
+                continue
+            ip, flags, mac, iface = parts[0], int(parts[2], 16), parts[3], parts[5]
+            state = NUD_STALE if flags & ATF_COM else NUD_INCOMPLETE
+            entries[ip] = (mac.lower(), state, iface)
+    return entries
+
+
+def read_neighbor_table():
+    """
+    Returns the kernel's IPv4 neighbour table as {ip: (mac, nud_state,
+    iface)}, from an rtnetlink dump or /proc/net/arp. Returns None where
+    neither is available, so callers can fall back to an active sweep.
+    """
+    if hasattr(socket, "AF_NETLINK"):
+        try:
+            return _dump_netlink()
+        except OSError as e:
+            print(f"[-] Netlink neighbour dump failed: {e}")
+    if os.path.exists(PROC_NET_ARP):
+        try:
+            return _read_proc_arp()
+        except OSError as e:
+            print(f"[-] Could not read {PROC_NET_ARP}: {e}")
+    return None
@@ -0,0 +1,164 @@
+import ipaddress
+import platform
+import select
+import socket
+import subprocess
+import threading
+import time
+
+import netifaces
+
+from slam.config import NETWORK_INFO_TTL, NETWORK_CHANGE_DEBOUNCE
+
+# rtnetlink multicast groups (linux/rtnetlink.h)
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+
+UNKNOWN_NETWORK = ("Unknown",) * 6
+
+
+def _probe_ssid():
+    system = platform.system()
+    try:
+        if system == "Darwin":
+            output = subprocess.check_output(
+                "ipconfig getsummary en0 | awk -F ' SSID : ' '/ SSID : / {print $2}'",
+                shell=True,
+            )
+        elif system == "Linux":
+            output = subprocess.check_output("iwgetid -r", shell=True)
+        else:
+            return "Unknown"
+        return output.decode().strip() or "Unknown"
+    except Exception:
+        return "Unknown"
+
+
+def probe_network_info():
+    """
+    Reads SSID, subnet and address of the default interface from the OS.
+    Spawns a process for the SSID, so callers should go through
+    NetworkState instead of calling this directly.
+    """
+    ssid = _probe_ssid()
+    iface = "Unknown"
+    try:
+        iface = netifaces.gateways()["default"][netifaces.AF_INET][1]
+        addr_info = netifaces.ifaddresses(iface)[netifaces.AF_INET][0]
+        ip = addr_info["addr"]
+        netmask = addr_info["netmask"]
+        broadcast = addr_info.get("broadcast", "Unknown")
+    except Exception:
+        ip = "192.168.0.1"
+        netmask = "255.255.255.255"
+        broadcast = "Unknown"
+
+    network = ipaddress.IPv4Network(f"{ip}/{netmask}", strict=False)
+    cidr = f"{network.network_address}/{network.prefixlen}"
+
+    return ssid, cidr, ip, netmask, iface, broadcast
+
+
+def _open_netlink():
+    if not hasattr(socket, "AF_NETLINK"):
+        return None
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE))
+        sock.setblocking(False)
+        return sock
+    except OSError as e:
+        print(f"[-] Netlink unavailable, polling network info instead: {e}")
+        return None
+
+
+def _drain(sock):
+    try:
+        while sock.recv(65536):
+            pass
+    except (BlockingIOError, InterruptedError):
+        pass
+
+
+class NetworkState:
+    """
+    Holds the last probed network info and refreshes it from a background
+    thread, so request handlers and daemons read it without spawning a
+    process. On Linux the thread wakes on rtnetlink link, address and route
+    events; everywhere the info is re-probed at least every `ttl` seconds.
+
+    Subscribers are called with (old, new) info whenever the SSID or subnet
+    changes. Netlink events are debounced until the link has been quiet for
+    `debounce` seconds, so a flapping interface yields a single change.
+    """
+
+    def __init__(self, ttl=NETWORK_INFO_TTL, debounce=NETWORK_CHANGE_DEBOUNCE):
+        self.ttl = ttl
+        self.debounce = debounce
+        self._info = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+
+    def get(self):
+        if self._thread is None:
+            self._start()
+        self._ready.wait()
+        return self._info
+
+    @property
+    def ssid(self):
+        return self.get()[0]
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def refresh(self):
+        try:
+            info = probe_network_info()
+        except Exception as e:
+            print(f"[-] Error reading network info: {e}")
+            info = self._info or UNKNOWN_NETWORK
+        previous, self._info = self._info, info
+        self._ready.set()
+        if previous is not None and previous[:2] != info[:2]:
+            print(
+                f"[+] Network changed: {previous[0]} ({previous[1]}) -> "
+                f"{info[0]} ({info[1]})"
+            )
+            for callback in list(self._subscribers):
+                try:
+                    callback(previous, info)
+                except Exception as e:
+                    print(f"[-] Network change subscriber failed: {e}")
+        return info
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.refresh()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        sock = _open_netlink()
+        while True:
+            if sock is None:
+                time.sleep(self.ttl)
+            elif select.select([sock], [], [], self.ttl)[0]:
+                # Events come in bursts (link up, address, routes) and links
+                # can flap; wait for a quiet period, bounded so a link that
+                # never settles is still picked up.
+                _drain(sock)
+                deadline = time.monotonic() + self.debounce * 6
+                while time.monotonic() < deadline and select.select(
+                    [sock], [], [], self.debounce
+                )[0]:
+                    _drain(sock)
+            self.refresh()
+
+
+network_state = NetworkState()
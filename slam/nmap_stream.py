@@ -0,0 +1,215 @@
+import asyncio
+import queue
+import shlex
+import threading
+import xml.etree.ElementTree as ET
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def parse_host(elem):
+    """
+    Converts one nmap XML <host> element into the same dict shape python-nmap
+    returns for scanner[ip], so callers can treat both sources alike.
+    """
+    host = {"hostnames": [], "addresses": {}, "vendor": {}, "status": {}}
+    status = elem.find("status")
+    if status is not None:
+        host["status"] = {
+            "state": status.get("state", ""),
+            "reason": status.get("reason", ""),
+        }
+    for address in elem.findall("address"):
+        addrtype, addr = address.get("addrtype"), address.get("addr")
+        host["addresses"][addrtype] = addr
+        if addrtype == "mac" and address.get("vendor"):
+            host["vendor"][addr] = address.get("vendor")
+    for hostname in elem.findall("hostnames/hostname"):
+        host["hostnames"].append(
+            {"name": hostname.get("name", ""), "type": hostname.get("type", "")}
+        )
+    for port in elem.findall("ports/port"):
+        proto = port.get("protocol")
+        state = port.find("state")
+        service = port.find("service")
+        service = service.attrib if service is not None else {}
+        host.setdefault(proto, {})[int(port.get("portid"))] = {
+            "state": state.get("state", "") if state is not None else "",
+            "reason": state.get("reason", "") if state is not None else "",
+            "name": service.get("name", ""),
+            "product": service.get("product", ""),
+            "version": service.get("version", ""),
+            "extrainfo": service.get("extrainfo", ""),
+            "conf": service.get("conf", ""),
+        }
+    ip = host["addresses"].get("ipv4") or host["addresses"].get("ipv6")
+    return ip, host
+
+
+async def parse_nmap_xml(stream):
+    """
+    Incrementally parses nmap -oX output from an asyncio StreamReader and
+    yields (ip, host) for every <host> that is up as soon as it closes.
+    Finished top-level elements are dropped so memory does not grow with the
+    size of the scan.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root, depth = None, 0
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == "start":
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            if elem.tag == "host":
+                ip, host = parse_host(elem)
+                if ip and host["status"].get("state", "up") == "up":
+                    yield ip, host
+            root.remove(elem)
+    parser.close()
+
+
+async def stream_nmap_hosts(targets, arguments):
+    if isinstance(targets, str):
+        targets = targets.split()
+    proc = await asyncio.create_subprocess_exec(
+        "nmap",
+        "-oX",
+        "-",
+        *shlex.split(arguments),
+        *targets,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    # stderr is drained alongside stdout; nmap can warn enough to fill the
+    # pipe, and would then block while we wait for more XML.
+    stderr = asyncio.create_task(proc.stderr.read())
+    try:
+        async for ip, host in parse_nmap_xml(proc.stdout):
+            yield ip, host
+        if await proc.wait() != 0:
+            errors = (await stderr).decode(errors="replace")
+            raise RuntimeError(f"nmap failed: {errors}")
+    finally:
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+        await proc.wait()
+        stderr.cancel()
+        await asyncio.gather(stderr, return_exceptions=True)
+
+
+async def stream_nmap_batches(batches, arguments, concurrency):
+    """
+    Runs one nmap process per batch, at most `concurrency` at a time, and
+    yields hosts from all of them in the order they complete.
+    """
+    results = asyncio.Queue()
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run(batch):
+        async with limit:
+            try:
+                async for item in stream_nmap_hosts(batch, arguments):
+                    await results.put(item)
+            except Exception as e:
+                print(f"[-] nmap failed for {batch}: {e}")
+        await results.put(_DONE)
+
+    tasks = [asyncio.create_task(run(batch)) for batch in batches]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item = await results.get()
+            if item is _DONE:
+                remaining -= 1
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def iter_async(agen, maxsize=256):
+    """
+    Drives an async generator on its own event loop thread and hands its
+    items to a plain (sync) generator through a bounded queue. Closing the
+    sync generator cancels the async one, which kills any nmap still
+    running; an error in the async generator is re-raised to the consumer.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    pumping = {}
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    async def pump():
+        pumping["loop"] = asyncio.get_running_loop()
+        pumping["task"] = asyncio.current_task()
+        if stop.is_set():
+            return
+        try:
+            async for item in agen:
+                if not put(item):
+                    break
+        finally:
+            await agen.aclose()
+
+    def run():
+        try:
+            asyncio.run(pump())
+            put(_DONE)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            put(_Failure(e))
+
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        # The pump may be waiting on nmap rather than on us; cancel it so an
+        # abandoned scan stops now instead of at its next host.
+        if "task" in pumping:
+            try:
+                pumping["loop"].call_soon_threadsafe(pumping["task"].cancel)
+            except RuntimeError:
+                pass
+
+
+def iter_nmap_hosts(targets, arguments):
+    return iter_async(stream_nmap_hosts(targets, arguments))
+
+
+def iter_nmap_batches(batches, arguments, concurrency):
+    return iter_async(stream_nmap_batches(batches, arguments, concurrency))
@@ -0,0 +1,48 @@
+from sqlalchemy import select, desc, and_, or_
+from slam.models import Notification
+
+
+def notification_filters(ssid=None, service=None, read=None, since=None, until=None):
+    filters = []
+    if ssid is not None:
+        filters.append(Notification.ssid == ssid)
+    if service is not None:
+        filters.append(Notification.service == service)
+    if read is not None:
+        filters.append(Notification.read == read)
+    if since is not None:
+        filters.append(Notification.timestamp >= since)
+    if until is not None:
+        filters.append(Notification.timestamp < until)
+    return filters
+
+
+def notifications_page(session, filters, limit, after=None):
+    """
+    Newest-first page of notifications matching `filters`, keyset-paginated
+    on (timestamp, id). `after` is the (timestamp, id) of the last row of
+    the previous page. Returns (rows, next) where `next` is the key to pass
+    for the following page, or None on the last page.
+    """
+    filters = list(filters)
+    if after is not None:
+        timestamp, id = after
+        # The plain <= bound gives SQLite a range to seek the timestamp index
+        # to; the or_() alone makes it scan every row before the cursor.
+        filters.append(Notification.timestamp <= timestamp)
+        filters.append(
+            or_(
+                Notification.timestamp < timestamp,
+                and_(Notification.timestamp == timestamp, Notification.id < id),
+            )
+        )
+    rows = session.execute(
+        select(Notification.__table__)
+        .where(*filters)
+        .order_by(desc(Notification.timestamp), desc(Notification.id))
+        .limit(limit + 1)
+    ).fetchall()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1].timestamp, rows[-1].id)
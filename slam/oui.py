@@ -0,0 +1,224 @@
+import argparse
+import csv
+import mmap
+import os
+import re
+import struct
+import threading
+from slam.config import OUI_DB_PATH
+
+# Vendor registries shipped with arp-scan, nmap and Wireshark. IEEE's own
+# oui.csv / mam.csv / oui36.csv can be fed to build() as well.
+OUI_SOURCES = [
+    os.path.join(prefix, name)
+    for prefix in ("/usr/share", "/usr/local/share", "/opt/homebrew/share")
+    for name in (
+        "arp-scan/ieee-oui.txt",
+        "arp-scan/mac-vendor.txt",
+        "nmap/nmap-mac-prefixes",
+        "wireshark/manuf",
+    )
+]
+
+RANDOMIZED_VENDOR = "Randomized MAC"
+
+# File layout: header, then fixed-size records sorted by (prefix, bits), then
+# NUL-terminated vendor names. Records store the prefix left-aligned in six
+# bytes, its length in bits and the offset of the vendor name.
+MAGIC = b"SLAMOUI1"
+HEADER = struct.Struct(">8sIIQ")
+RECORD = struct.Struct(">6sBI")
+KEY_SIZE = 7
+
+_HEX = re.compile(r"^[0-9A-Fa-f]+$")
+
+
+def _mac_bytes(mac):
+    digits = re.sub(r"[^0-9A-Fa-f]", "", mac or "")
+    if len(digits) != 12:
+        return None
+    return bytes.fromhex(digits)
+
+
+def _prefix_key(raw, bits):
+    value = int.from_bytes(raw, "big") >> (48 - bits) << (48 - bits)
+    return value.to_bytes(6, "big")
+
+
+def is_locally_administered(mac):
+    raw = _mac_bytes(mac)
+    return raw is not None and bool(raw[0] & 0x02)
+
+
+def _parse_line(line):
+    """
+    Returns (hex digits, bits, vendor) for one registry line in IEEE CSV,
+    Wireshark manuf ("00:1B:C5:00:00:00/36 Short Long") or arp-scan / nmap
+    ("001BC5 Vendor") format, or None.
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if line.count(",") >= 2 and line.split(",", 1)[0] in ("MA-L", "MA-M", "MA-S"):
+        row = next(csv.reader([line]))
+        digits, vendor = row[1], row[2]
+        bits = len(digits) * 4
+    else:
+        parts = line.split(None, 1)
+        if len(parts) < 2:
+            return None
+        prefix, vendor = parts
+        prefix, _, length = prefix.partition("/")
+        digits = re.sub(r"[:\-.]", "", prefix)
+        if not _HEX.match(digits):
+            return None
+        if length:
+            bits = int(length)
+        else:
+            bits = len(digits) * 4
+        # manuf lines carry a short and a long name; keep the long one.
+        vendor = vendor.split("\t")[-1]
+    vendor = vendor.strip()
+    if not _HEX.match(digits or "") or not vendor or not 0 < bits <= 48:
+        return None
+    return digits, bits, vendor
+
+
+def build(sources, output):
+    """
+    Compiles vendor registries into the compact sorted binary form read by
+    OuiDatabase. Later sources win for a prefix listed more than once.
+    """
+    entries = {}
+    for source in sources:
+        with open(source, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                parsed = _parse_line(line)
+                if parsed is None:
+                    continue
+                digits, bits, vendor = parsed
+                raw = bytes.fromhex(digits.ljust(12, "0")[:12])
+                entries[(_prefix_key(raw, bits), bits)] = vendor
+
+    names, name_offsets, records = bytearray(), {}, bytearray()
+    lengths = 0
+    for (key, bits), vendor in sorted(entries.items()):
+        if vendor not in name_offsets:
+            name_offsets[vendor] = len(names)
+            names += vendor.encode("utf-8") + b"\0"
+        records += RECORD.pack(key, bits, name_offsets[vendor])
+        lengths |= 1 << bits
+
+    names_offset = HEADER.size + len(records)
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{output}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(entries), names_offset, lengths))
+        f.write(records)
+        f.write(names)
+    os.replace(tmp, output)
+    return len(entries)
+
+
+class OuiDatabase:
+    """
+    Read-only view of a compiled registry. The file is memory-mapped, so
+    only the pages a lookup touches become resident.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self._names, lengths = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compiled OUI database")
+        # Longest registered prefix first, so MA-S beats MA-M beats MA-L.
+        self._lengths = [bits for bits in range(48, 0, -1) if lengths >> bits & 1]
+
+    def _find(self, target):
+        lo, hi = 0, self.count
+        base, size = HEADER.size, RECORD.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = base + mid * size
+            if self._map[start : start + KEY_SIZE] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        start = base + lo * size
+        if lo < self.count and self._map[start : start + KEY_SIZE] == target:
+            return RECORD.unpack_from(self._map, start)[2]
+        return None
+
+    def _name(self, offset):
+        start = self._names + offset
+        return self._map[start : self._map.find(b"\0", start)].decode("utf-8")
+
+    def lookup(self, mac):
+        raw = _mac_bytes(mac)
+        if raw is None:
+            return None
+        for bits in self._lengths:
+            offset = self._find(_prefix_key(raw, bits) + bytes([bits]))
+            if offset is not None:
+                return self._name(offset)
+        return None
+
+
+_database = None
+_loaded = False
+_lock = threading.Lock()
+
+
+def _open_database():
+    sources = [path for path in OUI_SOURCES if os.path.exists(path)]
+    try:
+        built = os.path.getmtime(OUI_DB_PATH)
+    except OSError:
+        built = None
+    if sources and (built is None or built < max(map(os.path.getmtime, sources))):
+        count = build(sources, OUI_DB_PATH)
+        print(f"[+] Built OUI vendor database with {count} prefixes")
+    elif built is None:
+        print("[-] No OUI vendor registry found; vendors come from arp-scan only")
+        return None
+    return OuiDatabase(OUI_DB_PATH)
+
+
+def get_database():
+    global _database, _loaded
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                try:
+                    _database = _open_database()
+                except (OSError, ValueError) as e:
+                    print(f"[-] Could not load OUI vendor database: {e}")
+                _loaded = True
+    return _database
+
+
+def lookup_vendor(mac):
+    """
+    Returns the registered vendor for a MAC address, RANDOMIZED_VENDOR for
+    locally administered (randomized) addresses, or None if unknown.
+    """
+    if is_locally_administered(mac):
+        return RANDOMIZED_VENDOR
+    database = get_database()
+    if database is None:
+        return None
+    return database.lookup(mac)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compile IEEE / arp-scan / nmap / Wireshark OUI registries"
+    )
+    parser.add_argument("sources", nargs="+")
+    parser.add_argument("--output", default=OUI_DB_PATH)
+    args = parser.parse_args()
+    count = build(args.sources, args.output)
+    print(f"[+] Wrote {count} prefixes to {args.output}")
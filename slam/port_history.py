@@ -0,0 +1,90 @@
+from sqlalchemy import select, func, and_
+from slam.models import PortEvent
+
+
+def _event(row):
+    return {
+        "ip_address": row.ip_address,
+        "mac_address": row.mac_address,
+        "port": row.port,
+        "proto": row.proto,
+        "state": row.state,
+        "timestamp": row.timestamp.isoformat(),
+    }
+
+
+def port_events(session, ssid, ip=None, port=None, since=None, until=None, limit=100):
+    """
+    Newest-first port events of an SSID, optionally for one host and/or
+    port and within [since, until).
+    """
+    table = PortEvent.__table__
+    query = select(table).where(table.c.ssid == ssid)
+    if ip is not None:
+        query = query.where(table.c.ip_address == ip)
+    if port is not None:
+        query = query.where(table.c.port == port)
+    if since is not None:
+        query = query.where(table.c.timestamp >= since)
+    if until is not None:
+        query = query.where(table.c.timestamp < until)
+    rows = session.execute(
+        query.order_by(table.c.timestamp.desc(), table.c.id.desc()).limit(limit)
+    ).fetchall()
+    return [_event(row) for row in rows]
+
+
+def first_opened(session, ssid, ip, port, proto="tcp"):
+    """
+    When `port` was first seen open on `ip`, or None.
+    """
+    table = PortEvent.__table__
+    return session.execute(
+        select(func.min(table.c.timestamp)).where(
+            table.c.ssid == ssid,
+            table.c.ip_address == ip,
+            table.c.port == port,
+            table.c.proto == proto,
+            table.c.state == "open",
+        )
+    ).scalar()
+
+
+def hosts_exposing(session, ssid, port, at, proto="tcp"):
+    """
+    Hosts whose latest event for `port` at or before `at` opened it, with
+    the time it was opened.
+    """
+    table = PortEvent.__table__
+    latest = (
+        select(
+            table.c.ip_address,
+            func.max(table.c.timestamp).label("timestamp"),
+        )
+        .where(
+            table.c.ssid == ssid,
+            table.c.port == port,
+            table.c.proto == proto,
+            table.c.timestamp <= at,
+        )
+        .group_by(table.c.ip_address)
+        .subquery()
+    )
+    rows = session.execute(
+        select(table)
+        .join(
+            latest,
+            and_(
+                table.c.ip_address == latest.c.ip_address,
+                table.c.timestamp == latest.c.timestamp,
+            ),
+        )
+        .where(
+            table.c.ssid == ssid,
+            table.c.port == port,
+            table.c.proto == proto,
+            table.c.state == "open",
+        )
+        .order_by(table.c.ip_address)
+    ).fetchall()
+    return [_event(row) for row in rows]
@@ -1,164 +1,179 @@
-import time
-import nmap
-from datetime import datetime
-from sqlalchemy import insert, update
-from slam.db import SessionLocal, ensure_device_table
-from slam.models import Subnet, Notification, get_device_table
+import heapq
+from datetime import datetime, timedelta
+from slam.db import SessionLocal, submit_write
+from slam.device_store import (
+    ensure_subnet,
+    record_port_scan,
+    advance_port_scan_cursor,
+)
+from slam.models import Subnet, Device, subnet_devices
+from slam.scanner import batch_port_scan, next_port_slice, top_tcp_ports
 from slam.ws_broadcast import broadcast
-import threading
-from sqlalchemy.exc import SQLAlchemyError, OperationalError
+from sqlalchemy.exc import SQLAlchemyError
 from slam.helper import get_ssid, get_network_info
 from slam.config import (
-    PORT_DISCOVERY_NOTIFICATION,
-    HOST_UPDATE_NOTIFICATION,
-    PORT_SCAN_TOP_PORTS,
     PORT_DISCOVERY_INTERVAL,
+    PORT_SCAN_TOP_PORTS,
+    PORT_SCAN_STALE_AFTER,
+    PORT_SCAN_OFFLINE_GRACE,
+    PORT_SCAN_MAX_HOSTS,
+    PORT_SCAN_ROTATE,
 )
 
-scanner = nmap.PortScanner()
+
+def hosts_due_for_port_scan(devices, now, limit=PORT_SCAN_MAX_HOSTS):
+    """
+    Picks up to `limit` hosts to rescan, most urgent first: hosts never
+    scanned or changed since their last scan, then the longest unscanned.
+    Hosts scanned within PORT_SCAN_STALE_AFTER minutes, and hosts offline
+    for longer than PORT_SCAN_OFFLINE_GRACE minutes, are left out.
+    """
+    stale_before = now - timedelta(minutes=PORT_SCAN_STALE_AFTER)
+    gone_before = now - timedelta(minutes=PORT_SCAN_OFFLINE_GRACE)
+    queue = []
+    for ip, device in devices.items():
+        if device.status == "offline" and (
+            device.last_seen is None or device.last_seen < gone_before
+        ):
+            continue
+        if device.last_port_scan is None:
+            queue.append((0, datetime.min, ip))
+        elif device.last_port_scan < stale_before:
+            queue.append((1, device.last_port_scan, ip))
+    return [ip for _, _, ip in heapq.nsmallest(limit, queue)]
+
+
+def _load_devices(ssid):
+    session = SessionLocal()
+    try:
+        return {
+            device.ip_address: device
+            for device in session.execute(
+                Device.__table__.select().where(subnet_devices(ssid))
+            ).fetchall()
+            if device.ip_address
+        }
+    finally:
+        session.close()
+
+
+def _load_port_scan_cursor(ssid):
+    session = SessionLocal()
+    try:
+        cursor = (
+            session.query(Subnet.port_scan_cursor).filter_by(ssid=ssid).scalar()
+        )
+        return cursor or 1
+    finally:
+        session.close()
+
+
+def _scan_and_record(
+    ssid, devices, ips, now, subnet_values, port_slice=None, merge=False
+):
+    """
+    Port scans `ips` and stores each result. `port_slice` is an (nmap -p
+    spec, set of ports) pair; only those ports are scanned and the result is
+    merged into the known ports. `merge` merges a top-ports result the same
+    way. Returns how many hosts gained new open ports.
+    """
+    spec, port_range = port_slice or (None, None)
+    if merge and not port_range:
+        # nmap only lists the ports it found open; closed ones are folded
+        # into <extraports>, so the requested set is what was covered.
+        port_range = set(top_tcp_ports(PORT_SCAN_TOP_PORTS))
+    writes = []
+    try:
+        for ip, tcp in batch_port_scan(ips, ports=spec):
+            open_ports = [p for p, d in tcp.items() if d.get("state") == "open"]
+            writes.append(
+                submit_write(
+                    record_port_scan,
+                    ssid,
+                    devices[ip],
+                    open_ports,
+                    now,
+                    subnet_values=subnet_values,
+                    scanned_ports=port_range,
+                )
+            )
+    except Exception as e:
+        print(f"Error Occured in Port Scan Stream : {e}")
+    changed = 0
+    for write in writes:
+        try:
+            if write.result():
+                changed += 1
+        except SQLAlchemyError as e:
+            print("DB Error in UPDATER:", e)
+    return changed
 
 
 def port_scan_hosts(ssid):
     print("[+] Port Scan Started")
-    session = SessionLocal()
     now = datetime.now()
-    table = get_device_table(ssid)
-    subnet_entry = session.query(Subnet).filter_by(ssid=ssid).first()
     ssid, subnet, ip, netmask, iface, broadcast = get_network_info()
-    if not subnet_entry:
-        subnet_entry = Subnet(
-            ssid=ssid,
-            subnet=subnet,
-            netmask=netmask,
-            iface=iface,
-            broadcast=broadcast,
-            created_at=now,
-            updated_by="Port Discovery Daemon",
-        )
-        session.add(subnet_entry)
-        session.commit()
-    subnet = subnet_entry.subnet
-    ensure_device_table(ssid)
-    devices = session.execute(table.select()).fetchall()
-    session.commit()
-    session.close()
-    for device in devices:
-        retry_attempts, retry_delay = 5, 2
-        try:
-            ip, hostname, old_ports, mac, vendor, status = (
-                device.ip_address,
-                device.hostname,
-                device.ports,
-                device.mac_address,
-                device.vendor,
-                device.status,
-            )
-            scanner.scan(hosts=ip, arguments=f"--top-ports {PORT_SCAN_TOP_PORTS} -T4")
-            port_info = scanner[ip]
-            open_ports = [
-                p
-                for p, d in port_info.get("tcp", {}).items()
-                if d.get("state") == "open"
-            ]
-            newly_discovered_ports = list(set(open_ports) - set(old_ports))
-            session = SessionLocal()
-            for attempt in range(retry_attempts):
-                try:
-                    if status == "offline":
-                        session.execute(
-                            update(table)
-                            .where(table.c.ip_address == ip)
-                            .values(last_seen=now, status="online")
-                        )
-                        if HOST_UPDATE_NOTIFICATION:
-                            session.add(
-                                Notification(
-                                    ssid=ssid,
-                                    ip_address=ip,
-                                    hostname=hostname,
-                                    service="Port Discovery Service",
-                                    message=f"Host {hostname} ({ip}) is back Online.",
-                                    timestamp=now,
-                                )
-                            )
-                    stmt = (
-                        update(table)
-                        .where(table.c.ip_address == ip)
-                        .values(last_seen=now, status="online", ports=open_ports)
-                    )
-                    result = session.execute(stmt)
-                    if result.rowcount == 0:
-                        stmt = insert(table).values(
-                            last_seen=now, status="online", ports=open_ports
-                        )
-                        session.execute(stmt)
-                    subnet_entry.last_activity = now
-                    subnet_entry.updated_by = "Port Discovery Daemon"
-                    subnet_entry.netmask = netmask
-                    subnet_entry.iface = iface
-                    subnet_entry.broadcast = broadcast
-                    session.add(subnet_entry)
-                    session.commit()
-                    if len(newly_discovered_ports) != 0:
-                        if PORT_DISCOVERY_NOTIFICATION:
-                            notif = Notification(
-                                ssid=ssid,
-                                ip_address=ip,
-                                hostname=hostname,
-                                message=f"New Open Ports discovered: {hostname} ({ip})\n {newly_discovered_ports}",
-                                timestamp=now,
-                                service="Port Discovery Service",
-                            )
-                            session.add(notif)
-                            session.commit()
-                    break
-                except OperationalError as oe:
-                    if "locked" in str(oe).lower():
-                        print(
-                            f"DB Lock detected. Retrying... ({attempt + 1}/{retry_attempts})"
-                        )
-                        session.rollback()
-                        time.sleep(retry_delay)
-                    else:
-                        print(f"DB Error in UPDATER: {oe}")
-                        session.rollback()
-                        break
-                except SQLAlchemyError as e:
-                    print("DB Error in UPDATER:", e)
-                    session.rollback()
-                    break
-                except Exception as e:
-                    print("DB Error in UPDATER:", e)
-                    session.rollback()
-                    break
-                finally:
-                    session.close()
-        except KeyError:
-            pass
-        except Exception as e:
-            print(f"Error Occured in Port Scan Stream : {e}")
-            pass
-    session.close()
-
-
-def send_ws_updates():
-    while True:
-        broadcast({"portscan_daemon": "alive", "timestamp": datetime.now().isoformat()})
-        time.sleep(5)
-
-
-def port_scan_run_forever():
-    print("[+] 🚀 Starting Port Scan Daemon")
-    threading.Thread(target=send_ws_updates, daemon=True).start()
-    time.sleep(3)
-    while True:
-        ssid = get_ssid()
-        if ssid != "Unknown":
-            port_scan_hosts(ssid)
-        else:
-            print("[-] Not Connected to Subnet")
-        time.sleep(PORT_DISCOVERY_INTERVAL * 60)
+    subnet_values = {
+        "updated_by": "Port Discovery Daemon",
+        "netmask": netmask,
+        "iface": iface,
+        "broadcast": broadcast,
+    }
+    submit_write(ensure_subnet, ssid, subnet, now, subnet_values).result()
+    devices = _load_devices(ssid)
+    due = hosts_due_for_port_scan(devices, now)
+
+    if not PORT_SCAN_ROTATE:
+        print(f"[+] Port scanning {len(due)} of {len(devices)} hosts")
+        changed = _scan_and_record(ssid, devices, due, now, subnet_values)
+        return changed, len(devices)
+
+    # Rotating mode: new and changed hosts get the top ports once, then every
+    # live host gets the next slice of the port space, so full coverage
+    # builds up over many cycles that each cost about one top-ports scan.
+    new = [ip for ip in due if devices[ip].last_port_scan is None]
+    changed = _scan_and_record(ssid, devices, new, now, subnet_values, merge=True)
+    devices = _load_devices(ssid)
+    live = [ip for ip, device in devices.items() if device.status != "offline"]
+    cursor = _load_port_scan_cursor(ssid)
+    spec, port_range, next_cursor = next_port_slice(cursor, PORT_SCAN_TOP_PORTS)
+    print(f"[+] Port scanning {len(live)} hosts on ports {spec}")
+    changed += _scan_and_record(
+        ssid, devices, live, now, subnet_values, port_slice=(spec, port_range)
+    )
+    submit_write(advance_port_scan_cursor, ssid, next_cursor).result()
+    return changed, len(devices)
+
+
+def send_heartbeat():
+    broadcast(
+        {"portscan_daemon": "alive", "timestamp": datetime.now().isoformat()},
+        key="portscan_daemon",
+    )
+
+
+def port_scan_job():
+    ssid = get_ssid()
+    if ssid == "Unknown":
+        print("[-] Not Connected to Subnet")
+        return None
+    return port_scan_hosts(ssid)
+
+
+def schedule(scheduler):
+    print("[+] 🚀 Scheduling Port Scan")
+    scheduler.add_job(
+        "port_scan", port_scan_job, PORT_DISCOVERY_INTERVAL * 60, initial_delay=3
+    )
+    scheduler.add_job(
+        "portscan_heartbeat",
+        send_heartbeat,
+        5,
+        exclusive=False,
+        adaptive=False,
+        jitter=0,
+    )
 
 
 if __name__ == "__main__":
-    port_scan_run_forever()
+    port_scan_job()
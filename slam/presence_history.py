@@ -0,0 +1,190 @@
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import select, delete, String, type_coerce
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from slam.models import PresenceDay
+from slam.config import PRESENCE_SLOT_MINUTES, PRESENCE_HISTORY_DAYS
+
+SLOTS_PER_DAY = 24 * 60 // PRESENCE_SLOT_MINUTES
+SLOTS_PER_HOUR = 60 // PRESENCE_SLOT_MINUTES
+BITMAP_BYTES = SLOTS_PER_DAY // 8
+
+
+def _slot(now):
+    return (now.hour * 60 + now.minute) // PRESENCE_SLOT_MINUTES
+
+
+def record_presence(conn, ssid, online, observed, now):
+    """
+    Marks the current slot for every IP in `observed`, setting its online
+    bit for those in `online`. Online wins within a slot, so only rows whose
+    bits actually change are rewritten. Runs inside a DB writer job; the
+    first write of a day also drops history older than
+    PRESENCE_HISTORY_DAYS.
+    """
+    if not observed:
+        return
+    table = PresenceDay.__table__
+    day = now.date()
+    byte, bit = divmod(_slot(now), 8)
+    # np.unpackbits reads the most significant bit first.
+    mask = 0x80 >> bit
+    rows = {
+        row.ip_address: row
+        for row in conn.execute(
+            select(table.c.ip_address, table.c.observed, table.c.online).where(
+                table.c.ssid == ssid, table.c.day == day
+            )
+        )
+    }
+    if not rows:
+        conn.execute(
+            delete(table).where(
+                table.c.ssid == ssid,
+                table.c.day < day - timedelta(days=PRESENCE_HISTORY_DAYS),
+            )
+        )
+
+    changed = []
+    for ip in observed:
+        up = ip in online
+        row = rows.get(ip)
+        if row is not None and row.observed[byte] & mask:
+            if row.online[byte] & mask or not up:
+                continue
+        seen = bytearray(row.observed if row is not None else BITMAP_BYTES)
+        bits = bytearray(row.online if row is not None else BITMAP_BYTES)
+        seen[byte] |= mask
+        if up:
+            bits[byte] |= mask
+        changed.append(
+            {
+                "ssid": ssid,
+                "ip_address": ip,
+                "day": day,
+                "observed": bytes(seen),
+                "online": bytes(bits),
+            }
+        )
+    if changed:
+        stmt = sqlite_insert(table)
+        conn.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[table.c.ssid, table.c.ip_address, table.c.day],
+                set_={
+                    "observed": stmt.excluded.observed,
+                    "online": stmt.excluded.online,
+                },
+            ),
+            changed,
+        )
+
+
+def load_bitmaps(session, ssid, start, end, ips=None):
+    """
+    Returns (ips, observed, online) for the days from `start` to `end`
+    inclusive, with the bitmaps unpacked into boolean arrays of shape
+    (hosts, days, SLOTS_PER_DAY). Days without a row are unobserved.
+    """
+    table = PresenceDay.__table__
+    # Days are read as their stored ISO strings and converted by NumPy in
+    # one go; a date object per row would cost more than the whole report.
+    query = select(
+        table.c.ip_address,
+        type_coerce(table.c.day, String),
+        table.c.observed,
+        table.c.online,
+    ).where(table.c.ssid == ssid, table.c.day >= start, table.c.day <= end)
+    if ips:
+        query = query.where(table.c.ip_address.in_(ips))
+    rows = session.execute(query).fetchall()
+    addresses, dates, seen, up = zip(*rows) if rows else ((),) * 4
+
+    hosts = sorted(set(addresses))
+    days = (end - start).days + 1
+    observed = np.zeros((len(hosts), days, BITMAP_BYTES), dtype=np.uint8)
+    online = np.zeros_like(observed)
+    if hosts:
+        index = {ip: i for i, ip in enumerate(hosts)}
+        host_idx = np.fromiter(map(index.__getitem__, addresses), np.intp)
+        day_idx = (
+            np.array(dates, dtype="datetime64[D]") - np.datetime64(start, "D")
+        ).astype(np.intp)
+        observed[host_idx, day_idx] = np.frombuffer(
+            b"".join(seen), np.uint8
+        ).reshape(-1, BITMAP_BYTES)
+        online[host_idx, day_idx] = np.frombuffer(b"".join(up), np.uint8).reshape(
+            -1, BITMAP_BYTES
+        )
+    online &= observed
+    # unpackbits yields 0/1 bytes, which are valid booleans as they are.
+    observed = np.unpackbits(observed, axis=2).view(bool)
+    online = np.unpackbits(online, axis=2).view(bool)
+    return hosts, observed, online
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, numerator / denominator * 100, np.nan)
+
+
+def _flaps(observed, online):
+    # A flap is a state change between two consecutive observed slots, so
+    # gaps between sweeps neither add nor hide flaps. The observed states of
+    # all hosts are packed end to end and compared with their predecessor;
+    # the first state of each host starts a new run and is not counted.
+    counts = np.count_nonzero(observed, axis=1)
+    states = online.ravel().take(np.flatnonzero(observed))
+    flipped = np.empty(len(states), dtype=bool)
+    flipped[0:1] = False
+    np.not_equal(states[1:], states[:-1], out=flipped[1:])
+    starts = np.cumsum(counts) - counts
+    present = counts > 0
+    flipped[starts[present]] = False
+    flaps = np.zeros(len(counts), dtype=np.int64)
+    if len(states):
+        flaps[present] = np.add.reduceat(flipped, starts[present], dtype=np.int64)
+    return flaps
+
+
+def _rounded(values):
+    return [None if v != v else v for v in np.round(values, 1).tolist()]
+
+
+def presence_report(session, ssid, days=30, ips=None, now=None):
+    """
+    Uptime percentage, hour-of-day availability and flap count per host over
+    the last `days` days, computed from the presence bitmaps. Percentages are
+    of observed slots only; None where a host was never observed.
+    """
+    end = (now or datetime.now()).date()
+    start = end - timedelta(days=days - 1)
+    hosts, observed, online = load_bitmaps(session, ssid, start, end, ips)
+    if not hosts:
+        return {"from": start.isoformat(), "to": end.isoformat(), "hosts": []}
+
+    # Sum over days first, then fold the day's slots into hours.
+    hourly = (len(hosts), 24, SLOTS_PER_HOUR)
+    observed_hourly = observed.sum(axis=1, dtype=np.int32).reshape(hourly).sum(2)
+    online_hourly = online.sum(axis=1, dtype=np.int32).reshape(hourly).sum(2)
+    observed_slots = observed_hourly.sum(axis=1)
+    uptime = _rounded(_ratio(online_hourly.sum(axis=1), observed_slots))
+    heatmap = _ratio(online_hourly, observed_hourly)
+    flaps = _flaps(observed.reshape(len(hosts), -1), online.reshape(len(hosts), -1))
+
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "hosts": [
+            {
+                "ip_address": ip,
+                "uptime": uptime[i],
+                "observed_hours": round(
+                    int(observed_slots[i]) * PRESENCE_SLOT_MINUTES / 60, 1
+                ),
+                "flaps": int(flaps[i]),
+                "heatmap": _rounded(heatmap[i]),
+            }
+            for i, ip in enumerate(hosts)
+        ],
+    }
@@ -0,0 +1,272 @@
+import argparse
+import ipaddress
+import select
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from slam.db import submit_write
+from slam.device_store import ensure_subnet, record_sightings
+from slam.dns_wire import parse_message, TYPE_A, FLAG_RESPONSE
+from slam.netstate import network_state
+from slam.config import PRESENCE_FLUSH_INTERVAL
+
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_P_ARP = 0x0806
+ETH_P_8021Q = 0x8100
+IPPROTO_UDP = 17
+DHCP_SERVER_PORT = 67
+MDNS_PORT = 5353
+DHCP_MAGIC = b"\x63\x82\x53\x63"
+DHCP_REQUEST = 3
+DHCP_INFORM = 8
+PCAP_LINKTYPE_ETHERNET = 1
+
+Sighting = namedtuple("Sighting", "ip mac hostname source")
+
+
+def _format_mac(raw):
+    return ":".join(f"{b:02X}" for b in raw)
+
+
+def _parse_arp(payload, src_mac):
+    if len(payload) < 28:
+        return None
+    hlen, plen = payload[4], payload[5]
+    if hlen != 6 or plen != 4:
+        return None
+    ip = socket.inet_ntoa(payload[14:18])
+    return Sighting(ip, _format_mac(payload[8:14]), None, "arp")
+
+
+def _dhcp_options(data):
+    options, offset = {}, 240
+    while offset < len(data):
+        code = data[offset]
+        if code == 255:
+            break
+        if code == 0:
+            offset += 1
+            continue
+        if offset + 1 >= len(data):
+            break
+        length = data[offset + 1]
+        options[code] = data[offset + 2 : offset + 2 + length]
+        offset += 2 + length
+    return options
+
+
+def _parse_dhcp(data):
+    # Only client REQUESTs and INFORMs name the address the client holds.
+    if len(data) < 240 or data[0] != 1 or data[236:240] != DHCP_MAGIC:
+        return None
+    options = _dhcp_options(data)
+    if options.get(53, b"\0")[0] not in (DHCP_REQUEST, DHCP_INFORM):
+        return None
+    ip = socket.inet_ntoa(data[12:16])
+    if ip == "0.0.0.0" and len(options.get(50, b"")) == 4:
+        ip = socket.inet_ntoa(options[50])
+    hostname = options.get(12, b"").decode("utf-8", "replace").strip("\0") or None
+    return Sighting(ip, _format_mac(data[28:34]), hostname, "dhcp")
+
+
+def _parse_mdns(data, src_ip, src_mac):
+    try:
+        message = parse_message(data)
+    except ValueError:
+        return None
+    hostname = None
+    if message.flags & FLAG_RESPONSE:
+        for record in message.answers:
+            if record.rtype == TYPE_A and record.value == src_ip and record.ttl:
+                hostname = record.name.rstrip(".")
+                break
+    return Sighting(src_ip, src_mac, hostname, "mdns")
+
+
+def parse_frame(frame):
+    """
+    Returns the Sighting an Ethernet frame reveals (an ARP sender, a DHCP
+    client's address or an mDNS speaker), or None.
+    """
+    if len(frame) < 14:
+        return None
+    src_mac = _format_mac(frame[6:12])
+    ethertype, offset = struct.unpack(">H", frame[12:14])[0], 14
+    if ethertype == ETH_P_8021Q and len(frame) >= 18:
+        ethertype, offset = struct.unpack(">H", frame[16:18])[0], 18
+    if ethertype == ETH_P_ARP:
+        return _parse_arp(frame[offset:], src_mac)
+    if ethertype != ETH_P_IP or len(frame) < offset + 20:
+        return None
+    ihl = (frame[offset] & 0x0F) * 4
+    fragment = struct.unpack(">H", frame[offset + 6 : offset + 8])[0] & 0x1FFF
+    if frame[offset + 9] != IPPROTO_UDP or fragment:
+        return None
+    src_ip = socket.inet_ntoa(frame[offset + 12 : offset + 16])
+    udp = offset + ihl
+    if len(frame) < udp + 8:
+        return None
+    sport, dport = struct.unpack(">HH", frame[udp : udp + 4])
+    data = frame[udp + 8 :]
+    if dport == DHCP_SERVER_PORT:
+        return _parse_dhcp(data)
+    if sport == MDNS_PORT:
+        return _parse_mdns(data, src_ip, src_mac)
+    return None
+
+
+def read_pcap(path):
+    """
+    Yields the frames of a classic libpcap capture of Ethernet traffic, for
+    replaying into PresenceListener.
+    """
+    with open(path, "rb") as f:
+        header = f.read(24)
+        magic = header[:4]
+        if magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+            order = ">"
+        elif magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+            order = "<"
+        else:
+            raise ValueError(f"{path} is not a pcap file")
+        linktype = struct.unpack(order + "I", header[20:24])[0]
+        if linktype != PCAP_LINKTYPE_ETHERNET:
+            raise ValueError(f"{path} does not contain Ethernet frames")
+        while True:
+            record = f.read(16)
+            if len(record) < 16:
+                return
+            length = struct.unpack(order + "I", record[8:12])[0]
+            yield f.read(length)
+
+
+class PresenceListener:
+    """
+    Watches ARP, DHCP and mDNS traffic on the local segment and records the
+    hosts it reveals as online, without waiting for the next sweep.
+    Sightings are coalesced per IP and written every `flush_interval`
+    seconds through record_sightings. Frames can be fed in directly with
+    handle_frame() or replay(), which is how captures are tested.
+    """
+
+    def __init__(self, iface=None, flush_interval=PRESENCE_FLUSH_INTERVAL):
+        self.iface = iface
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        network_state.subscribe(self._network_changed)
+
+    def _network_changed(self, previous, info):
+        # Sightings from the old network belong to the old SSID's table.
+        with self._lock:
+            self._pending = {}
+
+    def handle_frame(self, frame):
+        sighting = parse_frame(frame)
+        if sighting is None:
+            return None
+        ssid, subnet, own_ip = network_state.get()[:3]
+        if ssid == "Unknown" or sighting.ip == own_ip:
+            return None
+        try:
+            network = ipaddress.ip_network(subnet, strict=False)
+            ip = ipaddress.ip_address(sighting.ip)
+        except ValueError:
+            return None
+        if ip not in network or ip in (
+            network.network_address,
+            network.broadcast_address,
+        ):
+            return None
+        with self._lock:
+            seen = self._pending.get(sighting.ip)
+            if seen is not None:
+                sighting = sighting._replace(
+                    mac=sighting.mac or seen.mac,
+                    hostname=sighting.hostname or seen.hostname,
+                )
+            self._pending[sighting.ip] = sighting
+        return sighting
+
+    def flush(self):
+        with self._lock:
+            sightings, self._pending = list(self._pending.values()), {}
+        ssid, subnet = network_state.get()[:2]
+        if not sightings or ssid == "Unknown":
+            return None
+        now = datetime.now()
+        submit_write(ensure_subnet, ssid, subnet, now)
+        return submit_write(record_sightings, ssid, sightings, now)
+
+    def replay(self, frames):
+        """
+        Feeds captured frames through the listener and writes the result;
+        returns the writer future, or None if nothing was seen.
+        """
+        for frame in frames:
+            self.handle_frame(frame)
+        return self.flush()
+
+    def start(self):
+        if not hasattr(socket, "AF_PACKET"):
+            print("[-] Presence listener needs AF_PACKET sockets (Linux only)")
+            return False
+        try:
+            sock = socket.socket(
+                socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL)
+            )
+            if self.iface:
+                sock.bind((self.iface, 0))
+        except OSError as e:
+            print(f"[-] Could not open packet socket for presence listener: {e}")
+            return False
+        self._thread = threading.Thread(target=self._run, args=(sock,), daemon=True)
+        self._thread.start()
+        print(f"[+] Presence listener started on {self.iface or 'all interfaces'}")
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, sock):
+        next_flush = time.monotonic() + self.flush_interval
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([sock], [], [], self.flush_interval)
+                if ready:
+                    try:
+                        frame, address = sock.recvfrom(65535)
+                    except OSError:
+                        continue
+                    # Outgoing frames are ours; they say nothing about others.
+                    if address[2] != socket.PACKET_OUTGOING:
+                        self.handle_frame(frame)
+                if time.monotonic() >= next_flush:
+                    next_flush = time.monotonic() + self.flush_interval
+                    try:
+                        self.flush()
+                    except Exception as e:
+                        print(f"[-] Presence update failed: {e}")
+        finally:
+            sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Print the hosts a pcap capture reveals to the presence listener"
+    )
+    parser.add_argument("capture")
+    args = parser.parse_args()
+    for frame in read_pcap(args.capture):
+        sighting = parse_frame(frame)
+        if sighting:
+            print(
+                f"[+] {sighting.source:<5} {sighting.ip:<15} {sighting.mac} "
+                f"{sighting.hostname or ''}"
+            )
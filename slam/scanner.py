@@ -1,260 +1,327 @@
-import nmap
 from datetime import datetime
-from slam.db import SessionLocal, ensure_device_table
-from slam.mdns_resolver import resolve_hostname
-from slam.models import Subnet, Notification, get_device_table
-from sqlalchemy import insert, select, update, inspect
-from sqlalchemy.exc import SQLAlchemyError, OperationalError
+from slam.db import SessionLocal, submit_write
+from slam.device_store import ensure_subnet, record_sweep, record_port_scan
+from slam.models import Device, subnet_devices
+from sqlalchemy.exc import SQLAlchemyError
 import time
-from slam.nbtstat_resolver import get_nbtstat_name
-from slam.helper import get_device_info
+import queue
+import ipaddress
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from slam.nbtstat_resolver import NodeStatusBatcher
+from slam.hostname_resolver import ReverseDNSBatcher, resolve_host_name
+from slam.mdns_resolver import MulticastPtrBatcher
+from slam.nmap_stream import iter_nmap_hosts, iter_nmap_batches, iter_async
+from slam.connect_scan import stream_connect_scan, parse_port_spec
+from slam.connect_scan import top_ports as top_tcp_ports
+from slam.helper import get_device_info, SweepNeighbors
+from slam.neighbors import read_neighbor_table, NUD_FRESH, NUD_EXPIRED
 from slam.config import (
-    HOST_UPDATE_NOTIFICATION,
-    HOST_DISCOVERY_NOTIFICATION,
-    PORT_DISCOVERY_NOTIFICATION,
     PORT_SCAN_TOP_PORTS,
+    ENRICHMENT_WORKERS,
+    ENRICHMENT_HOST_TIMEOUT,
+    PORT_SCAN_BATCH_SIZE,
+    PORT_SCAN_WORKERS,
+    PORT_SCAN_ENGINE,
+    PORT_SCAN_ROTATE,
 )
 
-scanner = nmap.PortScanner()
 
+def enrich_host(
+    ip,
+    host,
+    neighbors=None,
+    netbios=None,
+    ptr=None,
+    mdns=None,
+    timeout=ENRICHMENT_HOST_TIMEOUT,
+):
+    """
+    Resolves MAC, vendor and hostname for one live IP. `netbios`, `ptr` and
+    `mdns` are the sweep's NetBIOS, reverse-DNS and mDNS batchers; the
+    hostname comes from the resolver chain, and a MAC nmap could not see is
+    taken from the NetBIOS reply if one arrives before the per-host deadline.
+    """
+    deadline = time.monotonic() + timeout
+    info = get_device_info(ip, host, neighbors)
+    nbstat = None
+    if info["MAC"] == "Unknown" and netbios is not None:
+        nbstat = netbios.lookup(ip)
+    info["Hostname"], _ = resolve_host_name(
+        ip, info["MAC"], host, ptr=ptr, netbios=netbios, mdns=mdns, timeout=timeout
+    )
+    remaining = deadline - time.monotonic()
+    if nbstat is not None and remaining > 0:
+        try:
+            result = nbstat.result(timeout=remaining)
+            info["MAC"] = result.get("netbios_mac", "Unknown")
+        except Exception:
+            pass
+    return info
+
+
+def enrich_hosts(hosts, subnet, iface=None, workers=ENRICHMENT_WORKERS):
+    """
+    Enriches (ip, host) pairs on a bounded worker pool while they are still
+    streaming in from nmap, and yields each host's info as soon as it is
+    ready, in completion order. Hosts whose enrichment fails are still
+    yielded with whatever nmap reported, so they count as seen; a failure of
+    the host stream itself is raised once the hosts already found are out.
+    """
+    neighbors = SweepNeighbors(subnet, iface)
+    netbios = NodeStatusBatcher()
+    ptr = ReverseDNSBatcher()
+    mdns = MulticastPtrBatcher()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    completed = queue.Queue()
+    stop = threading.Event()
+    submitted = {}
+    errors = []
+
+    def feed():
+        try:
+            for ip, host in hosts:
+                if stop.is_set():
+                    break
+                future = executor.submit(
+                    enrich_host, ip, host, neighbors, netbios, ptr, mdns
+                )
+                submitted[future] = ip
+                future.add_done_callback(completed.put)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            if hasattr(hosts, "close"):
+                hosts.close()
+            completed.put(None)
 
-def get_scanner_hostname(scanner, ip):
+    threading.Thread(target=feed, daemon=True).start()
     try:
-        return scanner[ip].hostname()
-    except Exception:
+        total, finished = None, 0
+        while total is None or finished < total:
+            future = completed.get()
+            if future is None:
+                total = len(submitted)
+                continue
+            finished += 1
+            try:
+                yield future.result()
+            except Exception as e:
+                ip = submitted.get(future)
+                print(f"[-] Enrichment failed for {ip}: {e}")
+                yield get_device_info(ip)
+        if errors:
+            raise errors[0]
+    finally:
+        # A closed SSE stream must not keep resolving hosts nobody will read.
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        netbios.close()
+        ptr.close()
+        mdns.close()
+
+
+def discover_live_hosts(targets):
+    """
+    Streams the hosts of an nmap -sn sweep as nmap reports them. `targets`
+    is a subnet or a list of addresses.
+    """
+    if isinstance(targets, str):
+        targets = [targets]
+    return iter_nmap_hosts(list(targets), "-sn -T4")
+
+
+def neighbor_host(ip, mac):
+    return {
+        "hostnames": [],
+        "addresses": {"ipv4": ip, "mac": mac},
+        "vendor": {},
+        "status": {"state": "up", "reason": "neighbor-table"},
+    }
+
+
+def passive_discover_hosts(subnet, iface=None, known=()):
+    """
+    Streams (ip, host) pairs for a sweep that trusts the kernel neighbour
+    table. Addresses with a fresh entry count as up without sending a
+    packet; only expired entries, and `known` live addresses without a
+    fresh entry, are probed with nmap -sn. Returns None when there is no
+    neighbour table to read, so the caller can run a full sweep instead.
+    """
+    table = read_neighbor_table()
+    if table is None:
         return None
+    network = ipaddress.ip_network(subnet, strict=False)
+    fresh, macs, probe = {}, {}, set()
+    for ip, (mac, state, dev) in table.items():
+        if iface not in (None, "Unknown") and dev and dev != iface:
+            continue
+        if not mac or mac == "00:00:00:00:00:00":
+            continue
+        if ipaddress.ip_address(ip) not in network:
+            continue
+        macs[ip] = mac
+        if state & NUD_FRESH:
+            fresh[ip] = mac
+        elif state & NUD_EXPIRED:
+            probe.add(ip)
+    probe.update(
+        ip
+        for ip in known
+        if ip not in fresh and ipaddress.ip_address(ip) in network
+    )
+    print(f"[+] Neighbour table: {len(fresh)} reachable, probing {len(probe)}")
+
+    def hosts():
+        for ip, mac in fresh.items():
+            yield ip, neighbor_host(ip, mac)
+        if probe:
+            for ip, host in discover_live_hosts(sorted(probe)):
+                if ip not in probe:
+                    continue
+                if "mac" not in host["addresses"] and ip in macs:
+                    host["addresses"]["mac"] = macs[ip]
+                yield ip, host
+
+    return hosts()
+
+
+def next_port_slice(cursor, size, last_port=65535):
+    """
+    Returns (nmap -p spec, set of ports, next cursor) for `size` ports
+    starting at `cursor`, wrapping around past the last port.
+    """
+    start = (cursor - 1) % last_port + 1
+    ports = [(start + i - 1) % last_port + 1 for i in range(size)]
+    end = ports[-1]
+    spec = f"{start}-{end}" if end >= start else f"{start}-{last_port},1-{end}"
+    return spec, set(ports), end % last_port + 1
+
+
+def nmap_port_scan(ips, top_ports, ports=None):
+    """
+    Splits the IPs into batches scanned by one nmap run each, with several
+    batches in flight at once.
+    """
+    ips = list(ips)
+    batch_size = PORT_SCAN_BATCH_SIZE
+    batches = [ips[i : i + batch_size] for i in range(0, len(ips), batch_size)]
+    if ports:
+        arguments = f"-p {ports} -T4"
+    else:
+        arguments = f"--top-ports {top_ports} -T4"
+    for ip, host in iter_nmap_batches(batches, arguments, PORT_SCAN_WORKERS):
+        yield ip, host.get("tcp", {})
+
+
+def connect_port_scan(ips, top_ports, ports=None):
+    """
+    Scans every IP in-process with asyncio TCP connects, without spawning
+    nmap.
+    """
+    port_list = parse_port_spec(ports) if ports else top_tcp_ports(top_ports)
+    yield from iter_async(stream_connect_scan(list(ips), port_list))
+
+
+SCAN_ENGINES = {
+    "nmap": nmap_port_scan,
+    "connect": connect_port_scan,
+}
+
+
+def batch_port_scan(
+    ips, top_ports=PORT_SCAN_TOP_PORTS, ports=None, engine=None
+):
+    """
+    Port scans the IPs with the configured engine and yields (ip, tcp) pairs
+    in python-nmap shape as each host finishes; hosts the engine did not
+    find up are left out. `ports` (an nmap -p spec) replaces the top-ports
+    list.
+    """
+    scan = SCAN_ENGINES[engine or PORT_SCAN_ENGINE]
+    yield from scan(ips, top_ports, ports)
 
 
 def stream_discover_hosts(subnet, ssid):
-    session = SessionLocal()
     now = datetime.now()
     print(f"[+] Starting Host Discovery on {ssid}")
-    # Ensure Subnet entry exists
-    existing = session.query(Subnet).filter_by(ssid=ssid).first()
-    if not existing:
-        subnet_entry = Subnet(ssid=ssid, subnet=subnet, created_at=now)
-        session.add(subnet_entry)
-        session.commit()
-
-    # Ensure per-SSID table exists
-    ensure_device_table(ssid)
-    table = get_device_table(ssid)
-    session.commit()
-    session.close()
+    submit_write(ensure_subnet, ssid, subnet, now).result()
     start_time = time.time()
-    scanner.scan(hosts=subnet, arguments="-sn -T4")
-    end_time = time.time()
-    print(
-        f"[+] IP discovery completed on SSID {ssid} Completed in {end_time - start_time:.2f} seconds."
-    )
-    for ip in scanner.all_hosts():
-        try:
-            start_time = time.time()
-            retry_attempts, retry_delay = 5, 2
-            info = get_device_info(ip)
-            ip, mac, vendor = info["IP"], info["MAC"], info["Vendor"]
-            hostname = get_scanner_hostname(scanner, ip) or info["Hostname"]
-            if hostname == "Unknown":
-                hostname = get_nbtstat_name(ip)
-                if hostname == "Unknown":
-                    hostname = resolve_hostname(ip)
-            # Check if IP already exists in SSID table
-            session = SessionLocal()
-            result = session.execute(select(table.c.ip_address)).fetchall()
-            existing_ips = {row[0] for row in result}
-            for attempt in range(retry_attempts):
-                try:
-                    if ip not in existing_ips:
-                        stmt = insert(table).values(
-                            ip_address=ip,
-                            hostname=hostname,
-                            status="online",
-                            mac_address=mac,
-                            vendor=vendor,
-                            first_seen=now,
-                            last_seen=now,
-                            ports=[],
-                        )
-                        if HOST_DISCOVERY_NOTIFICATION:
-                            notif = Notification(
-                                ssid=ssid,
-                                ip_address=ip,
-                                hostname=hostname,
-                                message=f"New host discovered: {hostname} ({ip})",
-                                timestamp=now,
-                                service="Host Discovery Service",
-                            )
-                            session.add(notif)
-                    else:
-                        stmt = (
-                            update(table)
-                            .where(table.c.ip_address == ip)
-                            .values(
-                                hostname=hostname,
-                                mac_address=mac,
-                                vendor=vendor,
-                                last_seen=now,
-                                status="online",
-                            )
-                        )
-                    session.execute(stmt)
-                    session.commit()
-                    break
-                except OperationalError as oe:
-                    if "locked" in str(oe).lower():
-                        print(
-                            f"DB Lock detected in Scanner. Retrying... ({attempt + 1}/{retry_attempts})"
-                        )
-                        session.rollback()
-                        time.sleep(retry_delay)
-                    else:
-                        print(f"DB Error in UPDATER: {oe}")
-                        session.rollback()
-                        break
-
-                except SQLAlchemyError as e:
-                    print("DB Error in UPDATER:", e)
-                    session.rollback()
-                    break
-
-                finally:
-                    session.close()
+    hosts = []
+    try:
+        for info in enrich_hosts(discover_live_hosts(subnet), subnet):
+            host = {
+                "ip_address": info["IP"],
+                "hostname": info["Hostname"],
+                "mac_address": info["MAC"],
+                "vendor": info["Vendor"],
+            }
+            hosts.append(host)
             end_time = time.time()
-            print(f"[+] Processed {ip} in {end_time - start_time:.2f} seconds.")
+            print(
+                f"[+] Processed {host['ip_address']} after {end_time - start_time:.2f} seconds."
+            )
             yield {
-                "ip_address": ip,
-                "hostname": hostname,
-                "mac_address": mac,
-                "vendor": vendor,
+                **host,
                 "status": "online",
                 "last_seen": now.isoformat(),
                 "ports": [],
             }
-        except KeyError:
-            pass
-        except Exception as e:
-            print(f"Error Occured in Discovery Scan Stream : {e}")
-            pass
-    session.close()
+    except Exception as e:
+        print(f"Error Occured in Discovery Scan Stream : {e}")
+    finally:
+        # Hosts already streamed are stored even if the client went away.
+        try:
+            submit_write(record_sweep, ssid, hosts, now, reconcile=False).result()
+        except SQLAlchemyError as e:
+            print("DB Error in UPDATER:", e)
+    end_time = time.time()
+    print(
+        f"[+] Host discovery on SSID {ssid} Completed in {end_time - start_time:.2f} seconds."
+    )
 
 
 def stream_port_scan(subnet, ssid):
-    session = SessionLocal()
     print(f"[+] Starting Port Scan on {ssid}")
     now = datetime.now()
-    table = get_device_table(ssid)
-    existing = session.query(Subnet).filter_by(ssid=ssid).first()
-    if not existing:
-        subnet_entry = Subnet(ssid=ssid, subnet=subnet, created_at=now)
-        session.add(subnet_entry)
-        session.commit()
-
-    inspector = inspect(session.bind)
-    if not inspector.has_table(table.name):
-        ensure_device_table(ssid)
-    session.commit()
-    session.close()
-    devices = session.execute(table.select()).fetchall()
-    for device in devices:
-        retry_attempts, retry_delay = 5, 2
-        try:
-            ip, hostname, old_ports, mac, vendor, status = (
-                device.ip_address,
-                device.hostname,
-                device.ports,
-                device.mac_address,
-                device.vendor,
-                device.status,
+    submit_write(ensure_subnet, ssid, subnet, now).result()
+    session = SessionLocal()
+    try:
+        devices = {
+            device.ip_address: device
+            for device in session.execute(
+                Device.__table__.select().where(subnet_devices(ssid))
+            ).fetchall()
+            if device.ip_address
+        }
+    finally:
+        session.close()
+    # Rotating scans build the stored ports up slice by slice; this scan only
+    # covers the top ports, so it must not close ports found outside them.
+    scanned_ports = None
+    if PORT_SCAN_ROTATE:
+        scanned_ports = set(top_tcp_ports(PORT_SCAN_TOP_PORTS))
+    try:
+        for ip, tcp in batch_port_scan(devices):
+            device = devices[ip]
+            open_ports = [p for p, d in tcp.items() if d.get("state") == "open"]
+            submit_write(
+                record_port_scan,
+                ssid,
+                device,
+                open_ports,
+                now,
+                service="Host Updater Daemon",
+                scanned_ports=scanned_ports,
             )
-            scanner.scan(hosts=ip, arguments=f"--top-ports {PORT_SCAN_TOP_PORTS} -T4")
-            port_info = scanner[ip]
-            open_ports = [
-                p
-                for p, d in port_info.get("tcp", {}).items()
-                if d.get("state") == "open"
-            ]
-            newly_discovered_ports = list(set(open_ports) - set(old_ports))
-            session = SessionLocal()
-            for attempt in range(retry_attempts):
-                try:
-                    if status == "offline":
-                        session.execute(
-                            update(table)
-                            .where(table.c.ip_address == ip)
-                            .values(last_seen=now, status="online")
-                        )
-                        if HOST_UPDATE_NOTIFICATION:
-                            session.add(
-                                Notification(
-                                    ssid=ssid,
-                                    ip_address=ip,
-                                    hostname=hostname,
-                                    service="Host Updater Daemon",
-                                    message=f"Host {hostname} ({ip}) is back Online.",
-                                    timestamp=now,
-                                )
-                            )
-                    stmt = (
-                        update(table)
-                        .where(table.c.ip_address == ip)
-                        .values(last_seen=now, status="online", ports=open_ports)
-                    )
-                    result = session.execute(stmt)
-                    if result.rowcount == 0:
-                        stmt = insert(table).values(
-                            last_seen=now, status="online", ports=open_ports
-                        )
-                        session.execute(stmt)
-                    session.commit()
-                    if len(newly_discovered_ports) != 0:
-                        if PORT_DISCOVERY_NOTIFICATION:
-                            notif = Notification(
-                                ssid=ssid,
-                                ip_address=ip,
-                                hostname=hostname,
-                                message=f"New Open Ports discovered: {hostname} ({ip})\n {newly_discovered_ports}",
-                                timestamp=now,
-                                service="Port Discovery Service",
-                            )
-                            session.add(notif)
-                            session.commit()
-                    break
-                except OperationalError as oe:
-                    if "locked" in str(oe).lower():
-                        print(
-                            f"DB Lock detected. Retrying... ({attempt + 1}/{retry_attempts})"
-                        )
-                        session.rollback()
-                        time.sleep(retry_delay)
-                    else:
-                        print(f"DB Error in UPDATER: {oe}")
-                        session.rollback()
-                        break
-                except SQLAlchemyError as e:
-                    print("DB Error in UPDATER:", e)
-                    session.rollback()
-                    break
-                except Exception as e:
-                    print("DB Error in UPDATER:", e)
-                    session.rollback()
-                    break
-
-                finally:
-                    session.close()
-                    if attempt == retry_attempts - 1:
-                        print("Max retry attempts reached. Exiting.")
             yield {
                 "ip_address": ip,
-                "hostname": hostname,
-                "mac_address": mac,
-                "vendor": vendor,
+                "hostname": device.hostname,
+                "mac_address": device.mac_address,
+                "vendor": device.vendor,
                 "status": "online",
                 "last_seen": now.isoformat(),
                 "ports": open_ports,
             }
-        except KeyError:
-            pass
-        except Exception as e:
-            print(f"Error Occured in Port Scan Stream : {e}")
-            pass
-    session.close()
+    except Exception as e:
+        print(f"Error Occured in Port Scan Stream : {e}")
@@ -0,0 +1,212 @@
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from slam.config import SCHEDULER_JITTER, SCHEDULER_CHURN_THRESHOLD
+
+
+class Job:
+    """
+    A periodic job. `func` is a blocking callable run in a worker thread; a
+    scan job returns (changes, total) so the scheduler can adapt its interval
+    to how much the network is churning, or None to keep the interval.
+    """
+
+    def __init__(
+        self,
+        name,
+        func,
+        interval,
+        exclusive=True,
+        adaptive=True,
+        jitter=SCHEDULER_JITTER,
+        min_interval=None,
+        max_interval=None,
+    ):
+        self.name = name
+        self.func = func
+        self.base_interval = interval
+        self.interval = interval
+        self.min_interval = min_interval or interval / 4
+        self.max_interval = max_interval or interval * 4
+        self.exclusive = exclusive
+        self.adaptive = adaptive
+        self.jitter = jitter
+        self.state = "idle"
+        self.next_run = None
+        self.triggered = False
+        self.runs = 0
+        self.skipped = 0
+        self.last_started = None
+        self.last_duration = None
+        self.last_result = None
+        self.last_error = None
+
+    def adapt(self, result):
+        if not self.adaptive or not result:
+            return
+        changes, total = result
+        if changes == 0:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        elif changes / max(total, 1) >= SCHEDULER_CHURN_THRESHOLD:
+            self.interval = max(self.min_interval, self.interval / 2)
+        else:
+            self.interval = self.base_interval
+
+    def schedule_next(self, now):
+        spread = self.interval * self.jitter
+        self.next_run = now + self.interval + random.uniform(-spread, spread)
+
+
+class Scheduler:
+    """
+    Runs every scan job on one event loop. Exclusive jobs share a lock so a
+    ping sweep and a port scan never hit the network at the same time; a
+    job that comes due while it is still queued or running is skipped
+    rather than stacked, and trigger() runs a job as soon as possible.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self._loop = None
+        self._wake = None
+        self._scan_lock = None
+
+    def add_job(self, name, func, interval, initial_delay=0, **options):
+        job = Job(name, func, interval, **options)
+        job.next_run = time.monotonic() + initial_delay
+        self.jobs[name] = job
+        return job
+
+    def start(self):
+        threading.Thread(target=lambda: asyncio.run(self._main()), daemon=True).start()
+
+    def trigger(self, name):
+        """
+        Runs a job now, or right after its current run; safe to call from
+        any thread.
+        """
+        job = self.jobs.get(name)
+        if job is None:
+            return
+        if self._loop is None:
+            job.next_run = time.monotonic()
+            return
+        self._loop.call_soon_threadsafe(self._trigger, job)
+
+    def _trigger(self, job):
+        if job.state == "idle":
+            job.next_run = time.monotonic()
+            self._wake.set()
+        elif job.state == "running":
+            job.triggered = True
+
+    def busy(self):
+        return self._scan_lock is not None and self._scan_lock.locked()
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Holds the lock exclusive jobs share for the length of the block, so
+        an on-demand scan started from another thread neither overlaps a
+        scheduled sweep nor is overlapped by one. Blocks until a running
+        exclusive job has finished.
+        """
+        loop = self._loop
+        if loop is None:
+            yield
+            return
+        asyncio.run_coroutine_threadsafe(self._scan_lock.acquire(), loop).result()
+        try:
+            yield
+        finally:
+            loop.call_soon_threadsafe(self._scan_lock.release)
+
+    def status(self):
+        now = time.monotonic()
+        return [
+            {
+                "name": job.name,
+                "state": job.state,
+                "interval": round(job.interval),
+                "base_interval": job.base_interval,
+                "next_run_in": round(max(job.next_run - now, 0)),
+                "runs": job.runs,
+                "skipped": job.skipped,
+                "last_started": (
+                    job.last_started.isoformat() if job.last_started else None
+                ),
+                "last_duration": (
+                    round(job.last_duration, 2)
+                    if job.last_duration is not None
+                    else None
+                ),
+                "last_result": job.last_result,
+                "last_error": job.last_error,
+            }
+            for job in list(self.jobs.values())
+        ]
+
+    async def _main(self):
+        self._wake = asyncio.Event()
+        self._scan_lock = asyncio.Lock()
+        # Published last: other threads take a set loop to mean the rest is.
+        self._loop = asyncio.get_running_loop()
+        tasks = set()
+        while True:
+            now = time.monotonic()
+            for job in self.jobs.values():
+                if job.next_run > now:
+                    continue
+                # Due again while the last run is still going: it overran
+                # its interval, so skip this slot instead of stacking runs.
+                job.schedule_next(now)
+                if job.state != "idle":
+                    job.skipped += 1
+                    print(f"[-] Skipping {job.name}: previous run still {job.state}")
+                    continue
+                job.state = "queued"
+                task = asyncio.create_task(self._run(job))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            due = [job.next_run for job in self.jobs.values()]
+            timeout = max(min(due) - time.monotonic(), 0) if due else None
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, job):
+        lock = self._scan_lock if job.exclusive else None
+        if lock:
+            await lock.acquire()
+        try:
+            job.state = "running"
+            job.last_started = datetime.now()
+            started = time.monotonic()
+            try:
+                result = await asyncio.to_thread(job.func)
+                job.last_result, job.last_error = result, None
+                job.adapt(result)
+            except Exception as e:
+                print(f"[-] Scheduled job {job.name} failed: {e}")
+                job.last_error = str(e)
+            job.runs += 1
+            job.last_duration = time.monotonic() - started
+        finally:
+            if lock:
+                lock.release()
+            job.state = "idle"
+            now = time.monotonic()
+            if job.triggered:
+                job.triggered = False
+                job.next_run = now
+            else:
+                job.schedule_next(now)
+            self._wake.set()
+
+
+scheduler = Scheduler()
@@ -2,32 +2,237 @@ import asyncio
 import websockets
 import threading
 import json
+import time
+import uuid
+from collections import deque
+from slam.config import (
+    WS_CLIENT_QUEUE_SIZE,
+    WS_SEND_TIMEOUT,
+    WS_SLOW_CLIENT_GRACE,
+    WS_EVENT_BUFFER,
+)
 
-active_clients = set()
+clients = set()
+_loop = None
+# Delta events carry a sequence number that is only meaningful within one
+# process; the epoch tells a reconnecting client whether it can resume.
+_epoch = uuid.uuid4().hex[:8]
+_seq = 0
+_seq_lock = threading.Lock()
+_events = deque(maxlen=WS_EVENT_BUFFER)
+_latencies = deque(maxlen=1024)
+_counters = {
+    "published": 0,
+    "delivered": 0,
+    "dropped": 0,
+    "coalesced": 0,
+    "disconnected_slow": 0,
+}
+
+
+class _Client:
+    """
+    One connected websocket and its bounded send queue. Messages published
+    with a key replace a queued message with the same key (heartbeats); when
+    the queue is full the oldest message is dropped, and a client whose
+    queue stays full for WS_SLOW_CLIENT_GRACE seconds is disconnected.
+    """
+
+    def __init__(self, websocket, maxsize=WS_CLIENT_QUEUE_SIZE):
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self.pending = deque()
+        self.keyed = {}
+        self.ready = asyncio.Event()
+        self.full_since = None
+        self.sent = 0
+        self.dropped = 0
+
+    def enqueue(self, key, msg, published_at):
+        if key is not None and key in self.keyed:
+            entry = self.keyed[key]
+            entry[1], entry[2] = msg, published_at
+            _counters["coalesced"] += 1
+            return
+        if len(self.pending) >= self.maxsize:
+            old_key, _, _ = self.pending.popleft()
+            if old_key is not None:
+                del self.keyed[old_key]
+            self.dropped += 1
+            _counters["dropped"] += 1
+            if self.full_since is None:
+                self.full_since = time.monotonic()
+            elif time.monotonic() - self.full_since > WS_SLOW_CLIENT_GRACE:
+                self.disconnect("queue stayed full")
+                return
+        else:
+            self.full_since = None
+        entry = [key, msg, published_at]
+        self.pending.append(entry)
+        if key is not None:
+            self.keyed[key] = entry
+        self.ready.set()
+
+    def disconnect(self, reason):
+        if self not in clients:
+            return
+        clients.discard(self)
+        self.ready.set()
+        _counters["disconnected_slow"] += 1
+        address = self.websocket.remote_address
+        print(f"[-] Dropping slow WebSocket client {address}: {reason}")
+        asyncio.ensure_future(self.websocket.close(code=1008, reason="too slow"))
+
+    async def run(self):
+        while self in clients:
+            if not self.pending:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            key, msg, published_at = self.pending.popleft()
+            if key is not None:
+                del self.keyed[key]
+            try:
+                await asyncio.wait_for(self.websocket.send(msg), WS_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.disconnect(f"send took longer than {WS_SEND_TIMEOUT}s")
+                return
+            except websockets.ConnectionClosed:
+                return
+            self.sent += 1
+            _counters["delivered"] += 1
+            _latencies.append(time.monotonic() - published_at)
+
+
+def _publish(key, msg, published_at):
+    _counters["published"] += 1
+    for client in list(clients):
+        client.enqueue(key, msg, published_at)
+
+
+def _latest_seq():
+    return _events[-1]["seq"] if _events else 0
+
+
+def _publish_event(event, published_at):
+    _events.append(event)
+    _publish(None, json.dumps(event), published_at)
+
+
+def _replay(client, request):
+    """
+    Queues the buffered events after request["since"] for a reconnecting
+    client, or tells it to resync from the REST API when they are gone.
+    """
+    since = request.get("since")
+    latest = _latest_seq()
+    if (
+        not isinstance(since, int)
+        or request.get("epoch", _epoch) != _epoch
+        or since > latest
+        or (_events and since < _events[0]["seq"] - 1)
+    ):
+        message = {"type": "resync", "epoch": _epoch, "seq": latest}
+        client.enqueue(None, json.dumps(message), time.monotonic())
+        return
+    for event in _events:
+        if event["seq"] > since:
+            client.enqueue(None, json.dumps(event), time.monotonic())
 
 
 def start_ws_server():
     async def handler(websocket):
-        active_clients.add(websocket)
+        client = _Client(websocket)
+        clients.add(client)
+        sender = asyncio.create_task(client.run())
+        hello = {"type": "hello", "epoch": _epoch, "seq": _latest_seq()}
+        client.enqueue(None, json.dumps(hello), time.monotonic())
         try:
-            await websocket.wait_closed()
+            async for message in websocket:
+                try:
+                    request = json.loads(message)
+                except ValueError:
+                    continue
+                if isinstance(request, dict) and "since" in request:
+                    _replay(client, request)
+        except websockets.ConnectionClosed:
+            pass
         finally:
-            active_clients.remove(websocket)
+            clients.discard(client)
+            sender.cancel()
 
     async def server_loop():
+        global _loop
+        _loop = asyncio.get_running_loop()
         async with websockets.serve(handler, "127.0.0.1", 6789):
             print("🔌 Shared WebSocket server started on ws://127.0.0.1:6789")
-            while True:
-                await asyncio.sleep(1)
+            await asyncio.Future()
 
     threading.Thread(target=lambda: asyncio.run(server_loop()), daemon=True).start()
 
 
-def broadcast(message_dict):
-    async def _send():
-        if not active_clients:
-            return
-        msg = json.dumps(message_dict)
-        await asyncio.gather(*[ws.send(msg) for ws in active_clients])
+def broadcast(message_dict, key=None):
+    """
+    Queues a message for every connected client; safe to call from any
+    thread. Messages sharing a `key` are coalesced so a slow client only
+    gets the latest one.
+    """
+    loop = _loop
+    if loop is None or loop.is_closed():
+        return
+    msg = json.dumps(message_dict)
+    try:
+        loop.call_soon_threadsafe(_publish, key, msg, time.monotonic())
+    except RuntimeError:
+        pass
+
+
+def publish_events(ssid, events):
+    """
+    Publishes typed device-state deltas for an SSID. Each event is a dict
+    with a "type" (host_added, host_online, host_offline, host_updated,
+    ports_changed) and only the fields that changed; it is stamped with the
+    next sequence number and kept in a ring buffer so clients can send
+    {"since": seq, "epoch": epoch} after reconnecting to catch up.
+    """
+    global _seq
+    loop = _loop
+    if loop is None or loop.is_closed() or not events:
+        return
+    with _seq_lock:
+        for event in events:
+            _seq += 1
+            event = {"seq": _seq, "epoch": _epoch, "ssid": ssid, **event}
+            try:
+                loop.call_soon_threadsafe(_publish_event, event, time.monotonic())
+            except RuntimeError:
+                return
+
+
+def stats():
+    latencies = sorted(_latencies)
+
+    def percentile(p):
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * p))
+        return round(latencies[index] * 1000, 2)
 
-    asyncio.run(_send())
+    return {
+        **_counters,
+        "event_seq": _seq,
+        "clients": [
+            {
+                "address": str(client.websocket.remote_address),
+                "queue_depth": len(client.pending),
+                "sent": client.sent,
+                "dropped": client.dropped,
+            }
+            for client in list(clients)
+        ],
+        "latency_ms": {
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+            "max": percentile(1.0),
+        },
+    }
@@ -198,10 +198,13 @@ export default function App() {
 
   const fetchNotifications = async () => {
     try {
-      const res = await fetch("http://localhost:5000/api/notifications");
+      const [res, countRes] = await Promise.all([
+        fetch("http://localhost:5000/api/notifications"),
+        fetch("http://localhost:5000/api/notifications/unread-count"),
+      ]);
       const data = await res.json();
+      const { unread } = await countRes.json();
       setNotifications(data);
-      const unread = data.filter((n) => !n.read).length;
       setUnreadCount(unread);
     } catch {
       setNotifications([]);
@@ -0,0 +1,10 @@
+import os
+import tempfile
+
+# slam.config reads its settings from slam.db in the working directory when
+# it is first imported, so give the tests a fresh database of their own.
+os.chdir(tempfile.mkdtemp(prefix="slam-tests-"))
+
+from slam.db import init_db  # noqa: E402
+
+init_db()
@@ -0,0 +1,136 @@
+import asyncio
+import socket
+import pytest
+from slam import connect_scan
+from slam.connect_scan import parse_port_spec, probe_port, stream_connect_scan
+
+@pytest.fixture
+def listener():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(16)
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+@pytest.fixture
+def closed_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _unanswered_port(ip):
+    """
+    A listener whose accept queue is already full, so the kernel drops
+    further SYNs and connects to it time out.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((ip, 0))
+    sock.listen(0)
+    port = sock.getsockname()[1]
+    backlog = []
+    for _ in range(3):
+        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client.setblocking(False)
+        client.connect_ex((ip, port))
+        backlog.append(client)
+    return port, [sock] + backlog
+
+
+@pytest.fixture
+def filtered():
+    """(ip, port) on a second loopback address that never answers."""
+    port, sockets = _unanswered_port("127.0.0.2")
+    yield "127.0.0.2", port
+    for sock in sockets:
+        sock.close()
+
+
+def _scan(*args, **kwargs):
+    async def collect():
+        return [item async for item in stream_connect_scan(*args, **kwargs)]
+
+    return asyncio.run(collect())
+
+
+def test_probe_port_states(listener, closed_port, filtered):
+    assert asyncio.run(probe_port("127.0.0.1", listener)) == "open"
+    assert asyncio.run(probe_port("127.0.0.1", closed_port)) == "closed"
+    state = asyncio.run(probe_port(*filtered, timeout=0.2, retries=1))
+    assert state == "filtered"
+
+
+def test_scan_reports_ports_in_python_nmap_shape(listener, closed_port):
+    [(ip, tcp)] = _scan(["127.0.0.1"], [closed_port, listener])
+    assert ip == "127.0.0.1"
+    assert list(tcp) == sorted([listener, closed_port])
+    assert tcp[listener]["state"] == "open"
+    assert tcp[listener]["reason"] == "syn-ack"
+    assert tcp[closed_port]["state"] == "closed"
+    assert tcp[closed_port]["reason"] == "conn-refused"
+    for entry in tcp.values():
+        assert set(entry) == {
+            "state",
+            "reason",
+            "name",
+            "product",
+            "version",
+            "extrainfo",
+            "conf",
+        }
+
+
+def test_hosts_with_only_filtered_ports_are_left_out(filtered):
+    ip, port = filtered
+    # Nothing listens on that port of 127.0.0.1, so it answers "closed".
+    results = _scan(["127.0.0.1", ip], [port], timeout=0.2, retries=0)
+    assert [(ip, tcp[port]["state"]) for ip, tcp in results] == [
+        ("127.0.0.1", "closed")
+    ]
+
+
+def test_scan_of_no_ports_yields_nothing():
+    assert _scan(["127.0.0.1"], []) == []
+
+
+def test_per_host_limit_caps_connections_in_flight(monkeypatch):
+    in_flight, peak = {}, {}
+
+    async def fake_probe(ip, port, timeout, retries):
+        in_flight[ip] = in_flight.get(ip, 0) + 1
+        peak[ip] = max(peak.get(ip, 0), in_flight[ip])
+        await asyncio.sleep(0.01)
+        in_flight[ip] -= 1
+        return "open" if port == 1 else "closed"
+
+    monkeypatch.setattr(connect_scan, "probe_port", fake_probe)
+    ips = ["10.0.0.1", "10.0.0.2"]
+    results = dict(_scan(ips, range(1, 41), concurrency=32, per_host=3))
+    assert set(results) == set(ips)
+    assert all(len(tcp) == 40 for tcp in results.values())
+    assert peak == {ip: 3 for ip in ips}
+
+
+@pytest.mark.parametrize(
+    "spec, ports",
+    [
+        ("22", [22]),
+        ("20-22", [20, 21, 22]),
+        ("443-443", [443]),
+        (" 80 , 8000-8001 ", [80, 8000, 8001]),
+        ("65534-65535,1-2", [65534, 65535, 1, 2]),
+        ("65534-", [65534, 65535]),
+        ("-3", [1, 2, 3]),
+    ],
+)
+def test_parse_port_spec(spec, ports):
+    assert parse_port_spec(spec) == ports
+
+
+@pytest.mark.parametrize("spec", ["", "http", "5-3", "0", "65536", "1-2-3", "80,"])
+def test_parse_port_spec_rejects_malformed_specs(spec):
+    with pytest.raises(ValueError):
+        parse_port_spec(spec)
@@ -0,0 +1,73 @@
+import threading
+import pytest
+from sqlalchemy import event, insert, select
+from slam.db import DBWriter, SessionLocal, engine
+from slam.models import Notification
+
+table = Notification.__table__
+
+
+@pytest.fixture
+def statements():
+    """Every SQL statement SQLite runs on connections checked out meanwhile."""
+    seen = []
+
+    def trace(dbapi_connection, connection_record, connection_proxy):
+        dbapi_connection.set_trace_callback(seen.append)
+
+    event.listen(engine, "checkout", trace)
+    yield seen
+    event.remove(engine, "checkout", trace)
+
+
+def _add(session, ssid, fail=False):
+    session.execute(insert(table).values(ssid=ssid, message="test"))
+    if fail:
+        raise RuntimeError("job failed")
+    return ssid
+
+
+def _stored(prefix):
+    session = SessionLocal()
+    try:
+        return set(
+            session.execute(
+                select(table.c.ssid).where(table.c.ssid.like(f"{prefix}%"))
+            ).scalars()
+        )
+    finally:
+        session.close()
+
+
+def _submit_group(writer, jobs):
+    # Holds the writer on a first job so the rest queue up as one group.
+    release = threading.Event()
+    blocker = writer.submit(lambda session: release.wait(5))
+    futures = [writer.submit(_add, *job) for job in jobs]
+    release.set()
+    blocker.result(timeout=5)
+    return futures
+
+
+def test_a_group_of_jobs_is_one_commit(statements):
+    writer = DBWriter()
+    futures = _submit_group(writer, [(f"group-{i}",) for i in range(10)])
+    assert [f.result(timeout=5) for f in futures] == [f"group-{i}" for i in range(10)]
+    # The blocking job writes nothing; the ten share one transaction.
+    assert statements.count("BEGIN") == 1
+    assert statements.count("COMMIT") == 1
+    assert statements.index("BEGIN") < statements.index("COMMIT")
+    assert statements[-1] == "COMMIT"
+    assert _stored("group-") == {f"group-{i}" for i in range(10)}
+
+
+def test_a_failing_job_is_rolled_back_alone():
+    writer = DBWriter()
+    futures = _submit_group(
+        writer, [("alone-a",), ("alone-b", True), ("alone-c",)]
+    )
+    assert futures[0].result(timeout=5) == "alone-a"
+    with pytest.raises(RuntimeError):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) == "alone-c"
+    assert _stored("alone-") == {"alone-a", "alone-c"}
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import delete, select
+from slam.db import SessionLocal
+from slam.device_store import ensure_subnet, record_sightings, record_sweep
+from slam.models import Device, Notification, Subnet
+from slam.presence_listener import Sighting
+
+SSID = "DeviceStoreTest"
+HOST = {
+    "ip_address": "10.9.0.5",
+    "hostname": "printer",
+    "mac_address": "aa:bb:cc:00:00:05",
+    "vendor": "Vendor",
+}
+
+
+@pytest.fixture
+def session():
+    session = SessionLocal()
+    ensure_subnet(session, SSID, "10.9.0.0/24", datetime.now())
+    session.commit()
+    yield session
+    session.rollback()
+    subnet_id = select(Subnet.id).where(Subnet.ssid == SSID).scalar_subquery()
+    session.execute(delete(Device).where(Device.subnet_id == subnet_id))
+    session.execute(delete(Notification).where(Notification.ssid == SSID))
+    session.execute(delete(Subnet).where(Subnet.ssid == SSID))
+    session.commit()
+    session.close()
+
+
+def _messages(session):
+    return session.execute(
+        select(Notification.message)
+        .where(Notification.ssid == SSID)
+        .order_by(Notification.id)
+    ).scalars().all()
+
+
+def test_sighting_brings_offline_host_back_online(session):
+    now = datetime.now()
+    record_sweep(session, SSID, [HOST], now)
+    record_sweep(session, SSID, [], now + timedelta(minutes=1))
+    session.commit()
+
+    sighting = Sighting(HOST["ip_address"], HOST["mac_address"], None, "arp")
+    record_sightings(session, SSID, [sighting], now + timedelta(minutes=2))
+    session.commit()
+
+    status = session.execute(
+        select(Device.status).where(Device.ip_address == HOST["ip_address"])
+    ).scalar()
+    assert status == "online"
+    assert _messages(session)[-2:] == [
+        "Host printer (10.9.0.5) is offline.",
+        "Host printer (10.9.0.5) is back Online.",
+    ]
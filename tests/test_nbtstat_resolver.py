@@ -0,0 +1,121 @@
+import socket
+import struct
+import threading
+import pytest
+from slam.nbtstat_resolver import (
+    NodeStatusBatcher,
+    build_node_status_query,
+    get_nbtstat_names,
+    parse_node_status_response,
+    GROUP_NAME_FLAG,
+    NBSTAT_TYPE,
+)
+
+MAC = bytes.fromhex("001122aabbcc")
+
+
+def _name_entry(name, suffix, flags=0):
+    return name.ljust(15).encode() + bytes([suffix]) + struct.pack(">H", flags)
+
+
+def _node_status_reply(txid, names, mac=MAC):
+    rdata = bytes([len(names)]) + b"".join(_name_entry(*n) for n in names) + mac
+    # The answer name points back at the question name, as Windows does.
+    return (
+        struct.pack(">HHHHHH", txid, 0x8400, 0, 1, 0, 0)
+        + b"\xc0\x0c"
+        + struct.pack(">HHIH", NBSTAT_TYPE, 1, 0, len(rdata))
+        + rdata
+    )
+
+
+NAMES = [
+    ("WORKGROUP", 0x00, GROUP_NAME_FLAG),
+    ("DESKTOP-1", 0x00),
+    ("DESKTOP-1", 0x20),
+    ("ALICE", 0x03),
+]
+
+
+@pytest.fixture
+def responder():
+    """A local NBNS responder answering every node status query with NAMES."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(0.1)
+    queries = []
+    stop = threading.Event()
+
+    def serve():
+        while not stop.is_set():
+            try:
+                data, addr = sock.recvfrom(512)
+            except socket.timeout:
+                continue
+            queries.append(data)
+            txid = struct.unpack(">H", data[:2])[0]
+            sock.sendto(_node_status_reply(txid, NAMES), addr)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield sock.getsockname()[1], queries
+    stop.set()
+    thread.join()
+    sock.close()
+
+
+def test_parse_node_status_response_picks_names_like_nmap():
+    txid, info = parse_node_status_response(_node_status_reply(7, NAMES), "10.0.0.5")
+    assert txid == 7
+    assert info == {
+        "ip": "10.0.0.5",
+        "netbios_name": "DESKTOP-1",
+        "netbios_user": "ALICE",
+        "netbios_mac": "00:11:22:aa:bb:cc",
+        "workgroup": "WORKGROUP",
+    }
+
+
+def test_parse_node_status_response_rejects_truncated_packets():
+    reply = _node_status_reply(7, NAMES)
+    with pytest.raises(ValueError):
+        parse_node_status_response(reply[:60], "10.0.0.5")
+    with pytest.raises(ValueError):
+        parse_node_status_response(build_node_status_query(7), "10.0.0.5")
+
+
+def test_get_nbtstat_names_queries_local_responder(responder):
+    port, queries = responder
+    results = get_nbtstat_names(["127.0.0.1"], timeout=2, port=port)
+    assert results["127.0.0.1"]["netbios_name"] == "DESKTOP-1"
+    assert results["127.0.0.1"]["workgroup"] == "WORKGROUP"
+    assert queries[0][2:] == build_node_status_query(0)[2:]
+
+
+def test_get_nbtstat_names_reports_silent_hosts_as_unknown():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    try:
+        results = get_nbtstat_names(
+            ["127.0.0.1"], timeout=0.2, port=sock.getsockname()[1]
+        )
+    finally:
+        sock.close()
+    assert results["127.0.0.1"]["netbios_name"] == "Unknown"
+
+
+def test_node_status_batcher_shares_one_query_per_ip(responder):
+    port, queries = responder
+
+    class LocalBatcher(NodeStatusBatcher):
+        def resolve(self, ips):
+            return get_nbtstat_names(ips, timeout=self.timeout, port=port)
+
+    batcher = LocalBatcher(window=0.05, timeout=2)
+    try:
+        futures = [batcher.lookup("127.0.0.1") for _ in range(3)]
+        assert futures[0] is futures[1] is futures[2]
+        assert futures[0].result(timeout=5)["netbios_name"] == "DESKTOP-1"
+    finally:
+        batcher.close()
+    assert len(queries) == 1
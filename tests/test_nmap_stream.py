@@ -0,0 +1,43 @@
+import os
+import time
+import pytest
+from slam.nmap_stream import iter_nmap_hosts
+
+# Reports one host, then hangs the way a long sweep does between hosts.
+FAKE_NMAP = """#!/bin/sh
+echo $$ > "{pidfile}"
+echo '<?xml version="1.0"?><nmaprun>'
+echo '<host><status state="up"/><address addr="10.0.0.1" addrtype="ipv4"/></host>'
+exec sleep 30
+"""
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # A killed child not yet reaped shows up as a zombie.
+    with open(f"/proc/{pid}/stat") as f:
+        return f.read().split(") ", 1)[1][0] != "Z"
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc")
+def test_closing_the_stream_kills_nmap(tmp_path, monkeypatch):
+    pidfile = tmp_path / "nmap.pid"
+    nmap = tmp_path / "nmap"
+    nmap.write_text(FAKE_NMAP.format(pidfile=pidfile))
+    nmap.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+    hosts = iter_nmap_hosts("10.0.0.0/24", "-sn")
+    ip, host = next(hosts)
+    assert ip == "10.0.0.1"
+    pid = int(pidfile.read_text())
+    assert _alive(pid)
+
+    hosts.close()
+    deadline = time.monotonic() + 5
+    while _alive(pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not _alive(pid)
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import delete, event, insert
+from slam.db import SessionLocal, engine
+from slam.models import Notification
+from slam.notifications import notification_filters, notifications_page
+
+SSID = "PagingTest"
+START = datetime(2026, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def session():
+    # Five timestamps with three notifications each, so page boundaries fall
+    # inside runs of equal timestamps.
+    rows = [
+        {
+            "ssid": SSID,
+            "message": f"{minute}-{n}",
+            "timestamp": START + timedelta(minutes=minute),
+            "read": False,
+        }
+        for minute in range(5)
+        for n in range(3)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(Notification.__table__), rows)
+    session = SessionLocal()
+    yield session
+    session.close()
+    with engine.begin() as conn:
+        conn.execute(delete(Notification.__table__).where(Notification.ssid == SSID))
+
+
+def _all_pages(session, limit):
+    filters = notification_filters(ssid=SSID)
+    pages, after = [], None
+    while True:
+        rows, after = notifications_page(session, filters, limit, after)
+        pages.append(rows)
+        if after is None:
+            return pages
+
+
+@pytest.mark.parametrize("limit", [1, 2, 4, 15, 20])
+def test_pages_cover_every_row_once_in_order(session, limit):
+    pages = _all_pages(session, limit)
+    rows = [row for page in pages for row in page]
+    keys = [(row.timestamp, row.id) for row in rows]
+    assert len(keys) == 15
+    assert keys == sorted(set(keys), reverse=True)
+    assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_last_page_has_no_cursor(session):
+    rows, after = notifications_page(session, notification_filters(ssid=SSID), 15)
+    assert len(rows) == 15 and after is None
+
+
+def test_cursor_query_seeks_the_timestamp_index(session):
+    filters = notification_filters(ssid=SSID)
+    _, after = notifications_page(session, filters, 4)
+    executed = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        executed.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        notifications_page(session, filters, 4, after)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    statement, parameters = executed[-1]
+    plan = session.connection().exec_driver_sql(
+        f"EXPLAIN QUERY PLAN {statement}", parameters
+    )
+    # A range on timestamp, not just an index scan from the newest row.
+    assert any("timestamp<?" in row[-1].replace(" ", "") for row in plan)
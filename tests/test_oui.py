@@ -0,0 +1,61 @@
+import pytest
+from slam.oui import OuiDatabase, build, lookup_vendor, RANDOMIZED_VENDOR
+
+# The same block registered at every size: 70:B3:D5 is an IEEE MA-L whose
+# range is also sold off as MA-M and MA-S blocks.
+IEEE_CSV = """Registry,Assignment,Organization Name,Organization Address
+MA-L,70B3D5,IEEE Registration Authority,US
+MA-M,70B3D5F,Medium Block Inc,US
+MA-S,70B3D5F2F,Small Block Ltd,US
+MA-L,001BC5,"Converging Systems, Inc.",US
+"""
+
+MANUF = """# Wireshark manuf
+00:00:0C\tCisco\tCisco Systems, Inc
+00:1B:C5:00:00:00/36\tConverg\tConverging Systems Override
+"""
+
+
+@pytest.fixture
+def database(tmp_path):
+    ieee = tmp_path / "oui.csv"
+    ieee.write_text(IEEE_CSV)
+    manuf = tmp_path / "manuf"
+    manuf.write_text(MANUF)
+    output = tmp_path / "oui.bin"
+    assert build([str(ieee), str(manuf)], str(output)) == 6
+    return OuiDatabase(str(output))
+
+
+def test_longest_prefix_wins(database):
+    assert database.lookup("70:B3:D5:F2:F0:01") == "Small Block Ltd"
+    assert database.lookup("70:B3:D5:F3:00:01") == "Medium Block Inc"
+    assert database.lookup("70:B3:D5:01:00:01") == "IEEE Registration Authority"
+
+
+def test_ma_s_block_from_manuf_only_covers_its_range(database):
+    assert database.lookup("00-1B-C5-00-00-42") == "Converging Systems Override"
+    assert database.lookup("00:1B:C5:10:00:42") == "Converging Systems, Inc."
+
+
+def test_lookup_accepts_any_separator_and_case(database):
+    assert database.lookup("00000c123456") == "Cisco Systems, Inc"
+    assert database.lookup("00.00.0c.12.34.56") == "Cisco Systems, Inc"
+
+
+def test_unknown_and_malformed_macs(database):
+    assert database.lookup("FC:FF:FF:00:00:01") is None
+    assert database.lookup("00:00:0C") is None
+    assert database.lookup(None) is None
+
+
+def test_build_skips_unparseable_lines(tmp_path):
+    source = tmp_path / "mixed.txt"
+    source.write_text("001BC5 Converging\nnot-a-prefix Vendor\n001BC5\n\n")
+    output = tmp_path / "oui.bin"
+    assert build([str(source)], str(output)) == 1
+
+
+def test_randomized_macs_are_flagged_without_a_lookup():
+    assert lookup_vendor("02:00:00:00:00:01") == RANDOMIZED_VENDOR
+    assert lookup_vendor("DA:A1:19:00:00:01") == RANDOMIZED_VENDOR
@@ -0,0 +1,157 @@
+import socket
+import struct
+import pytest
+from slam.db import SessionLocal
+from slam.dns_wire import FLAG_RESPONSE, TYPE_A, TYPE_PTR, encode_name
+from slam.models import Device, subnet_devices
+from slam.netstate import network_state
+from slam.presence_listener import PresenceListener, parse_frame, read_pcap
+
+SSID = "PresenceTest"
+NETWORK = (SSID, "192.168.7.0/24", "192.168.7.2", "255.255.255.0", "eth0", "")
+BROADCAST = b"\xff" * 6
+
+
+def _mac(text):
+    return bytes.fromhex(text.replace(":", ""))
+
+
+def _ethernet(src, ethertype, payload, vlan=None):
+    header = BROADCAST + _mac(src)
+    if vlan is not None:
+        header += struct.pack(">HH", 0x8100, vlan)
+    return header + struct.pack(">H", ethertype) + payload
+
+
+def arp_frame(mac, ip, vlan=None):
+    payload = struct.pack(">HHBBH", 1, 0x0800, 6, 4, 1)
+    payload += _mac(mac) + socket.inet_aton(ip) + b"\0" * 6 + socket.inet_aton(ip)
+    return _ethernet(mac, 0x0806, payload, vlan)
+
+
+def udp_frame(mac, src_ip, dst_ip, sport, dport, data):
+    udp = struct.pack(">HHHH", sport, dport, 8 + len(data), 0) + data
+    ip = struct.pack(
+        ">BBHHHBBH4s4s",
+        0x45,
+        0,
+        20 + len(udp),
+        0,
+        0,
+        64,
+        17,
+        0,
+        socket.inet_aton(src_ip),
+        socket.inet_aton(dst_ip),
+    )
+    return _ethernet(mac, 0x0800, ip + udp)
+
+
+def dhcp_request(mac, requested_ip, hostname):
+    data = struct.pack(">BBBBIHH", 1, 1, 6, 0, 0x1234, 0, 0)
+    data += b"\0" * 16 + _mac(mac) + b"\0" * 10 + b"\0" * 192
+    data += b"\x63\x82\x53\x63"
+    data += b"\x35\x01\x03"
+    data += b"\x32\x04" + socket.inet_aton(requested_ip)
+    data += bytes([12, len(hostname)]) + hostname.encode()
+    data += b"\xff"
+    return udp_frame(mac, "0.0.0.0", "255.255.255.255", 68, 67, data)
+
+
+def mdns_announcement(mac, ip, hostname, rtype=TYPE_A):
+    rdata = socket.inet_aton(ip) if rtype == TYPE_A else encode_name(hostname)
+    data = struct.pack(">HHHHHH", 0, FLAG_RESPONSE | 0x0400, 0, 1, 0, 0)
+    data += encode_name(hostname)
+    data += struct.pack(">HHIH", rtype, 0x8001, 120, len(rdata)) + rdata
+    return udp_frame(mac, ip, "224.0.0.251", 5353, 5353, data)
+
+
+def test_parse_arp_frame():
+    sighting = parse_frame(arp_frame("00:11:22:33:44:55", "192.168.7.20"))
+    assert sighting == ("192.168.7.20", "00:11:22:33:44:55", None, "arp")
+
+
+def test_parse_vlan_tagged_arp_frame():
+    frame = arp_frame("00:11:22:33:44:55", "192.168.7.20", vlan=12)
+    assert parse_frame(frame).ip == "192.168.7.20"
+
+
+def test_parse_dhcp_request_uses_requested_address_and_hostname():
+    sighting = parse_frame(dhcp_request("00:11:22:33:44:66", "192.168.7.30", "laptop"))
+    assert sighting == ("192.168.7.30", "00:11:22:33:44:66", "laptop", "dhcp")
+
+
+def test_parse_mdns_announcement_names_its_sender():
+    frame = mdns_announcement("00:11:22:33:44:77", "192.168.7.40", "printer.local")
+    sighting = parse_frame(frame)
+    assert sighting == ("192.168.7.40", "00:11:22:33:44:77", "printer.local", "mdns")
+
+
+def test_parse_mdns_without_own_address_record_has_no_hostname():
+    frame = mdns_announcement(
+        "00:11:22:33:44:77", "192.168.7.40", "printer.local", rtype=TYPE_PTR
+    )
+    assert parse_frame(frame).hostname is None
+
+
+@pytest.mark.parametrize(
+    "frame",
+    [
+        b"",
+        b"\xff" * 13,
+        arp_frame("00:11:22:33:44:55", "192.168.7.20")[:30],
+        udp_frame("00:11:22:33:44:55", "192.168.7.9", "192.168.7.1", 1000, 53, b""),
+        dhcp_request("00:11:22:33:44:66", "192.168.7.30", "laptop")[:200],
+    ],
+)
+def test_parse_frame_ignores_other_and_truncated_frames(frame):
+    assert parse_frame(frame) is None
+
+
+@pytest.fixture
+def listener(monkeypatch):
+    monkeypatch.setattr(network_state, "get", lambda: NETWORK)
+    return PresenceListener()
+
+
+def _stored_devices():
+    session = SessionLocal()
+    try:
+        rows = session.execute(
+            Device.__table__.select().where(subnet_devices(SSID))
+        ).fetchall()
+        return {row.ip_address: row for row in rows}
+    finally:
+        session.close()
+
+
+def test_replay_merges_sightings_and_skips_foreign_addresses(listener, tmp_path):
+    frames = [
+        arp_frame("00:11:22:33:44:55", "192.168.7.20"),
+        mdns_announcement("00:11:22:33:44:55", "192.168.7.20", "nas.local"),
+        dhcp_request("00:11:22:33:44:66", "192.168.7.30", "laptop"),
+        arp_frame("00:11:22:33:44:88", "10.0.0.5"),
+        arp_frame("00:11:22:33:44:99", "192.168.7.2"),
+        arp_frame("00:11:22:33:44:aa", "192.168.7.255"),
+    ]
+    capture = tmp_path / "presence.pcap"
+    with open(capture, "wb") as f:
+        f.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        for frame in frames:
+            f.write(struct.pack("<IIII", 0, 0, len(frame), len(frame)) + frame)
+
+    listener.replay(read_pcap(str(capture))).result(timeout=10)
+
+    devices = _stored_devices()
+    assert set(devices) == {"192.168.7.20", "192.168.7.30"}
+    assert devices["192.168.7.20"].hostname == "nas.local"
+    assert devices["192.168.7.20"].mac_address == "00:11:22:33:44:55"
+    assert devices["192.168.7.30"].hostname == "laptop"
+    assert all(device.status == "online" for device in devices.values())
+
+
+def test_read_pcap_rejects_other_files(tmp_path):
+    path = tmp_path / "not.pcap"
+    path.write_bytes(b"\0" * 24)
+    with pytest.raises(ValueError):
+        list(read_pcap(str(path)))